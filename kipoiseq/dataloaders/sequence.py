@@ -11,9 +11,9 @@ from kipoi_conda.dependencies import Dependencies
 from kipoi.specs import Author
 from kipoi_utils.utils import default_kwargs
 
-from kipoiseq.extractors import FastaStringExtractor
+from kipoiseq.extractors import FastaStringExtractor, SharedMemoryFastaExtractor, FastaOneHotExtractor
 from kipoiseq.transforms import SwapAxes, DummyAxis, Compose, OneHot, ReorderedOneHot
-from kipoiseq.transforms.functional import resize_interval
+from kipoiseq.transforms.functional import resize_intervals
 from kipoiseq.utils import to_scalar, parse_dtype
 
 import pybedtools
@@ -113,6 +113,15 @@ class BedDataset(object):
         if excl_chromosomes is not None:
             self.df = self.df[~self.df[0].isin(excl_chromosomes)]
 
+    def resize(self, width, anchor='center'):
+        """Resize all the intervals in-place. See also `kipoiseq.transforms.functional.resize_interval`
+
+        # Arguments
+          width: desired width of the intervals
+          anchor (str): which part of the interval should be anchored. Choices: 'start', 'center', or 'end'
+        """
+        self.df[1], self.df[2] = resize_intervals(self.df[1].values, self.df[2].values, width, anchor)
+
     def __getitem__(self, idx):
         """Returns (pybedtools.Interval, labels)
         """
@@ -165,6 +174,10 @@ class StringSeqIntervalDl(Dataset):
             doc: Force uppercase output of sequences
         ignore_targets:
             doc: if True, don't return any target variables
+        shared_memory:
+            doc: >
+                if True, the reference genome is loaded once into shared memory and
+                shared by all the dataloader workers
     output_schema:
         inputs:
             name: seq
@@ -194,7 +207,8 @@ class StringSeqIntervalDl(Dataset):
                  # max_seq_len=None,
                  # use_strand=False,
                  force_upper=True,
-                 ignore_targets=False):
+                 ignore_targets=False,
+                 shared_memory=False):
 
         self.num_chr_fasta = num_chr_fasta
         self.intervals_file = intervals_file
@@ -215,7 +229,16 @@ class StringSeqIntervalDl(Dataset):
                               bed_columns=3,
                               label_dtype=parse_dtype(label_dtype),
                               ignore_targets=ignore_targets)
-        self.fasta_extractors = None
+        if self.auto_resize_len:
+            # automatically resize all the sequences to the required length
+            self.bed.resize(self.auto_resize_len, anchor='center')
+        if shared_memory:
+            # load the genome before the workers are started. Workers attach to the segment
+            # when the dataset is pickled or share the mapping after fork.
+            self.fasta_extractors = SharedMemoryFastaExtractor(self.fasta_file, use_strand=False,
+                                                               force_upper=self.force_upper)
+        else:
+            self.fasta_extractors = None
 
     def __len__(self):
         return len(self.bed)
@@ -225,21 +248,20 @@ class StringSeqIntervalDl(Dataset):
             self.fasta_extractors = FastaStringExtractor(self.fasta_file, use_strand=False,  # self.use_strand,
                                                          force_upper=self.force_upper)
 
-        interval, labels = self.bed[idx]
+        # Run the fasta extractor and transform if necessary
+        return self._get_item(idx, lambda interval: np.array(self.fasta_extractors.extract(interval)))
 
-        if self.auto_resize_len:
-            # automatically resize the sequence to cerat
-            interval = resize_interval(interval, self.auto_resize_len, anchor='center')
+    def _get_item(self, idx, extract):
+        """Item `idx` with the inputs returned by `extract(interval)`
+        """
+        interval, labels = self.bed[idx]
 
         # QUESTION: @kromme - why to we need max_seq_len?
         # if self.max_seq_len is not None:
         #     assert interval.stop - interval.start <= self.max_seq_len
 
-        # Run the fasta extractor and transform if necessary
-        seq = self.fasta_extractors.extract(interval)
-
         return {
-            "inputs": np.array(seq),
+            "inputs": extract(interval),
             "targets": labels,
             "metadata": {
                 "ranges": GenomicRanges(interval.chrom, interval.start, interval.stop, str(idx))
@@ -296,9 +318,13 @@ class SeqIntervalDl(Dataset):
                 alphabet to use for the one-hot encoding. This defines the order of the one-hot encoding.
                 Can either be a list or a string: 'ACGT' or ['A, 'C', 'G', 'T']. Default: 'ACGT'
         dtype:
-            doc: 'defines the numpy dtype of the returned array. Example: int, np.int32, np.float32, float'
+            doc: 'defines the numpy dtype of the returned array. Example: int, np.int32, np.float32, float, np.float16, np.uint8, bool'
         ignore_targets:
             doc: if True, don't return any target variables
+        shared_memory:
+            doc: >
+                if True, the reference genome is loaded once into shared memory and
+                shared by all the dataloader workers
 
     output_schema:
         inputs:
@@ -332,25 +358,34 @@ class SeqIntervalDl(Dataset):
                  dummy_axis=None,
                  alphabet="ACGT",
                  ignore_targets=False,
-                 dtype=None):
+                 dtype=None,
+                 shared_memory=False):
         # core dataset, not using the one-hot encoding params
         self.seq_dl = StringSeqIntervalDl(intervals_file, fasta_file, num_chr_fasta=num_chr_fasta,
                                           label_dtype=label_dtype, auto_resize_len=auto_resize_len,
                                           # use_strand=use_strand,
-                                          ignore_targets=ignore_targets)
-
-        self.input_transform = ReorderedOneHot(alphabet=alphabet,
-                                               dtype=dtype,
-                                               alphabet_axis=alphabet_axis,
-                                               dummy_axis=dummy_axis)
+                                          ignore_targets=ignore_targets,
+                                          shared_memory=shared_memory)
+
+        self.one_hot_kwargs = dict(alphabet=alphabet,
+                                   dtype=dtype,
+                                   alphabet_axis=alphabet_axis,
+                                   dummy_axis=dummy_axis)
+        self.input_transform = ReorderedOneHot(**self.one_hot_kwargs)
+        self.fasta_file = fasta_file
+        self.shared_memory = shared_memory
+        self.fasta_extractor = None
 
     def __len__(self):
         return len(self.seq_dl)
 
     def __getitem__(self, idx):
-        ret = self.seq_dl[idx]
-        ret['inputs'] = self.input_transform(str(ret["inputs"]))
-        return ret
+        if self.fasta_extractor is None:
+            # encode the fasta bytes directly, without intermediate strings. The shared
+            # memory genome is loaded by the string dataloader.
+            source = self.seq_dl.fasta_extractors if self.shared_memory else self.fasta_file
+            self.fasta_extractor = FastaOneHotExtractor(source, **self.one_hot_kwargs)
+        return self.seq_dl._get_item(idx, self.fasta_extractor.extract)
 
     @classmethod
     def get_output_schema(cls):
@@ -1,2 +1,5 @@
 from .base import *
 from .vcf_seq import *
+from .memmap import *
+from .shared_memory import *
+from .one_hot import *
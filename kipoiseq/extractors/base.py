@@ -1,6 +1,16 @@
 import abc
+import asyncio
+import functools
+import os
+import threading
+import weakref
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 
-__all__ = ["BaseExtractor", "FastaStringExtractor"]  # "BigWigExtractor"]
+import numpy as np
+from kipoiseq.transforms.transforms import LRUCache
+
+__all__ = ["BaseExtractor", "FastaStringExtractor", "BigWigExtractor"]
 
 
 class BaseExtractor(object):
@@ -19,65 +29,431 @@ class BaseExtractor(object):
         # implemented by the subclass
         pass
 
+    # asyncio interface
+    async def aextract(self, *args, executor=None, **kwargs):
+        """Run `extract` in an executor without blocking the event loop
+
+        # Arguments
+          *args, **kwargs: arguments passed to `extract`
+          executor: concurrent.futures executor. If None, the default executor of the loop is used.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(self.extract, *args, **kwargs))
+
+    async def _aextract_many(self, args_iter, max_concurrency=16, executor=None, **kwargs):
+        """Run `extract(*args, **kwargs)` for each `args` with at most `max_concurrency` calls in flight
+
+        Yields the results in the order of `args_iter`.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency needs to be at least 1")
+        loop = asyncio.get_running_loop()
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_concurrency)
+        pending = deque()
+        try:
+            for args in args_iter:
+                pending.append(loop.run_in_executor(executor, functools.partial(self.extract, *args, **kwargs)))
+                if len(pending) >= max_concurrency:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for future in pending:
+                future.cancel()
+            if own_executor:
+                executor.shutdown(wait=False)
+
+    def aextract_batch(self, intervals, max_concurrency=16, executor=None, **kwargs):
+        """Extract many intervals concurrently
+
+        The extractor needs to be thread-safe (e.g. `FastaStringExtractor`).
+
+        # Arguments
+          intervals: iterable of pybedtools.Interval
+          max_concurrency: maximum number of `extract` calls in flight
+          executor: concurrent.futures executor. If None, a thread pool with
+            `max_concurrency` threads is used.
+          **kwargs: additional arguments passed to `extract`
+
+        # Returns
+          async generator yielding the results in the order of `intervals`
+        """
+        return self._aextract_many(((interval,) for interval in intervals),
+                                   max_concurrency=max_concurrency, executor=executor, **kwargs)
+
+
+# extractors whose locks are replaced in the child process after fork. The child can't
+# acquire a lock inherited from the parent, if another parent thread held it at fork time.
+_fork_safe_extractors = weakref.WeakSet()
+
+
+def _reset_locks_after_fork():
+    for extractor in list(_fork_safe_extractors):
+        extractor._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
 
 class FastaStringExtractor(BaseExtractor):
     """Fasta file extractor
 
-    NOTE: The extractor is not thread-save.
-    If you with to use it with multiprocessing,
-    create a new extractor object in each process.
+    The extractor is thread-safe: sequences of uncompressed fasta files are read
+    with positional reads (`os.pread`) which don't share the file offset. Hence, `aextract`
+    and `aextract_batch` can be used to overlap many reads from asyncio code. The extractor
+    can be pickled: the file is re-opened lazily after unpickling or after fork.
+
+    Bgzip-compressed fasta files are read through a `BgzfBlockReader` caching the
+    decompressed blocks. `extract_batch` decompresses the blocks in parallel.
 
     # Arguments
       fasta_file (str): path to the fasta_file
       use_strand (bool): if True, the extracted sequence
         is reverse complemented in case interval.strand == "-"
       force_upper (bool): Force uppercase output
+      bgzf_cache_bytes: maximum total size of the decompressed BGZF blocks kept in memory
+      bgzf_threads: number of threads decompressing the BGZF blocks in `extract_batch`
     """
 
-    def __init__(self, fasta_file, use_strand=False, force_upper=False):
-        from pyfaidx import Fasta
-
+    def __init__(self, fasta_file, use_strand=False, force_upper=False,
+                 bgzf_cache_bytes=2 ** 26, bgzf_threads=1):
         self.fasta_file = fasta_file
         self.use_strand = use_strand
-        self.fasta = Fasta(self.fasta_file)
         self.force_upper = force_upper
+        self.bgzf_cache_bytes = bgzf_cache_bytes
+        self.bgzf_threads = bgzf_threads
+        self._lock = threading.Lock()
+        self._fasta = None
+        self._fd = None
+        self._bgzf_reader = None
+        self._pid = None
+        _fork_safe_extractors.add(self)
+        # open the file right away to fail early
+        self._open()
+
+    def _open(self):
+        from pyfaidx import Fasta
+
+        with self._lock:
+            if self._fasta is not None and self._pid == os.getpid():
+                return
+            # files inherited from the parent process share the file offset
+            self._close_files()
+            fasta = Fasta(self.fasta_file)
+            if getattr(fasta.faidx, "_bgzf", False):
+                from kipoiseq.extractors.bgzf import BgzfBlockReader
+                self._bgzf_reader = BgzfBlockReader(self.fasta_file,
+                                                    [(b.cstart, b.ustart) for b in fasta.faidx.gzi_index],
+                                                    cache_max_bytes=self.bgzf_cache_bytes,
+                                                    num_threads=self.bgzf_threads)
+            elif hasattr(os, "pread"):
+                self._fd = os.open(self.fasta_file, os.O_RDONLY)
+            self._fasta = fasta
+            self._pid = os.getpid()
+
+    @property
+    def fasta(self):
+        """pyfaidx.Fasta object of the current process
+        """
+        if self._fasta is None or self._pid != os.getpid():
+            self._open()
+        return self._fasta
+
+    def _byte_range(self, chrom, start, end):
+        """Byte offset and length of the sequence `[start, end)` (0-based) in the (uncompressed) file
+
+        Same semantics as `pyfaidx.Fasta.get_seq`: negative starts raise a FetchError
+        and the sequence is truncated at the chromosome end.
+        """
+        from pyfaidx import FetchError
+
+        try:
+            record = self.fasta.faidx.index[chrom]
+        except KeyError:
+            raise FetchError("Requested rname {0} does not exist! "
+                             "Please check your FASTA file.".format(chrom))
+        if start < 0:
+            raise FetchError("Requested start coordinate must be greater than 1.")
+        end = min(end, record.rlen)
+        if end <= start:
+            return 0, 0
+        # byte offsets of the first and the last base
+        bstart = record.offset + (start // record.lenc) * record.lenb + start % record.lenc
+        blast = record.offset + ((end - 1) // record.lenc) * record.lenb + (end - 1) % record.lenc
+        return bstart, blast + 1 - bstart
+
+    def _read_bytes(self, chrom, start, end, bgzf_blocks=None):
+        """Read the raw bytes of the sequence `[start, end)` (0-based) of chromosome `chrom`
+
+        # Arguments
+          bgzf_blocks: (optional) decompressed blocks returned by `BgzfBlockReader.prefetch`
+        """
+        fasta = self.fasta
+        if self._fd is None and self._bgzf_reader is None:
+            with self._lock:
+                return fasta.faidx.from_file(chrom, start + 1, end).encode("ascii")
+
+        offset, length = self._byte_range(chrom, start, end)
+        if self._bgzf_reader is not None:
+            seq = self._bgzf_reader.read(offset, length, bgzf_blocks)
+        else:
+            seq = os.pread(self._fd, length, offset)
+        if b'\n' in seq or b'\r' in seq:
+            seq = seq.replace(b'\n', b'').replace(b'\r', b'')
+        return seq
+
+    def _read(self, chrom, start, end):
+        return self._read_bytes(chrom, start, end).decode()
 
     def extract(self, interval):
-        # reverse-complement seq the negative strand
-        rc = self.use_strand and interval.strand == "-"
+        from pyfaidx import complement
 
-        # pyfaidx wants a 1-based interval
-        seq = str(self.fasta.get_seq(interval.chrom,
-                                     interval.start + 1, interval.stop, rc=rc).seq)
+        seq = self._read(interval.chrom, interval.start, interval.stop)
 
         # optionally, force upper-case letters
         if self.force_upper:
             seq = seq.upper()
+
+        # reverse-complement seq the negative strand
+        if self.use_strand and interval.strand == "-":
+            seq = complement(seq)[::-1]
         return seq
 
+    def extract_batch(self, intervals, max_gap=0):
+        """Extract the sequences of many intervals
+
+        Intervals are grouped by chromosome and read in genomic order. Overlapping
+        intervals or intervals closer than `max_gap` are read from the file only once.
+
+        # Arguments
+          intervals: list of pybedtools.Interval
+          max_gap: merge the reads of intervals separated by at most `max_gap` bp
+
+        # Returns
+          list of sequences (`str`) in the same order as `intervals`
+        """
+        from pyfaidx import complement
+
+        seqs = [None] * len(intervals)
+        by_chrom = defaultdict(list)
+        for i, interval in enumerate(intervals):
+            by_chrom[interval.chrom].append(i)
+
+        for chrom, idx in by_chrom.items():
+            idx = sorted(idx, key=lambda i: intervals[i].start)
+            # coalesce the nearby intervals into blocks: [(start, end, [interval index])]
+            blocks = []
+            for i in idx:
+                interval = intervals[i]
+                if blocks and interval.start <= blocks[-1][1] + max_gap:
+                    blocks[-1][1] = max(blocks[-1][1], interval.stop)
+                    blocks[-1][2].append(i)
+                else:
+                    blocks.append([interval.start, interval.stop, [i]])
+            by_chrom[chrom] = blocks
+
+        bgzf_blocks = None
+        self._open()
+        if self._bgzf_reader is not None:
+            # decompress all the required blocks at once
+            bgzf_blocks = self._bgzf_reader.prefetch([self._byte_range(chrom, start, end)
+                                                      for chrom, blocks in by_chrom.items()
+                                                      for start, end, _ in blocks])
+
+        for chrom, blocks in by_chrom.items():
+            for start, end, block_idx in blocks:
+                block_seq = self._read_bytes(chrom, start, end, bgzf_blocks).decode()
+                if self.force_upper:
+                    block_seq = block_seq.upper()
+                for i in block_idx:
+                    interval = intervals[i]
+                    seq = block_seq[interval.start - start:interval.stop - start]
+                    if self.use_strand and interval.strand == "-":
+                        seq = complement(seq)[::-1]
+                    seqs[i] = seq
+        return seqs
+
+    def extract_packed(self, interval):
+        """Extract the sequence as `PackedSeq` (see `kipoiseq.transforms.functional.PackedSeq`)
+
+        Lower-case letters are stored as upper-case and non-ACGT bases as N.
+        """
+        from kipoiseq.extractors.memmap import reverse_complement_bytes
+        from kipoiseq.transforms import functional as F
+
+        arr = np.frombuffer(self._read_bytes(interval.chrom, interval.start, interval.stop), dtype=np.uint8)
+        if self.use_strand and interval.strand == "-":
+            arr = reverse_complement_bytes(arr)
+        return F._chars2packed(arr)
+
+    def _close_files(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._bgzf_reader is not None:
+            self._bgzf_reader.close()
+            self._bgzf_reader = None
+        if self._fasta is not None:
+            self._fasta.close()
+            self._fasta = None
+
+    def __getstate__(self):
+        # the file is re-opened lazily by the new process
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        state["_fasta"] = None
+        state["_fd"] = None
+        state["_bgzf_reader"] = None
+        state["_pid"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        _fork_safe_extractors.add(self)
+
     def close(self):
-        return self.fasta.close()
+        if getattr(self, "_lock", None) is None:
+            return
+        with self._lock:
+            self._close_files()
 
 
-# class BigWigExtractor(BaseExtractor):
-#     """Big-wig file extractor
+class BigWigExtractor(BaseExtractor):
+    """Big-wig file extractor
 
-#     NOTE: The extractor is not thread-save.
-#     If you with to use it with multiprocessing,
-#     create a new extractor object in each process.
+    The signal is read in fixed-size genomic blocks kept in a `LRUCache`
+    bounded by `cache_max_bytes`. Overlapping or adjacent intervals hence
+    don't read and decompress the same data from the file again.
+    Like `FastaStringExtractor`, the extractor is thread-safe and can be pickled.
 
-#     # Arguments
-#       bigwig_file: path to the bigwig file
-#     """
+    # Arguments
+      bigwig_file: path to the bigwig file
+      bin_size: if set, average the signal in non-overlapping bins of `bin_size` bp
+      nan_value: value of the positions without data (including positions outside
+        of the chromosome). If None, these positions are NaN.
+      block_size: size of the cached blocks in bp
+      cache_max_bytes: maximum total size of the cached blocks in bytes
+    """
+
+    def __init__(self, bigwig_file, bin_size=None, nan_value=0., block_size=2 ** 16, cache_max_bytes=2 ** 28):
+        self.bigwig_file = bigwig_file
+        self.bin_size = bin_size
+        self.nan_value = nan_value
+        self.block_size = block_size
+        self.cache_max_bytes = cache_max_bytes
+        self.cache = LRUCache(cache_max_bytes)
+        self._lock = threading.Lock()
+        self._bw = None
+        self._pid = None
+        # open the file right away to fail early
+        self._open()
+
+    def _open(self):
+        import pyBigWig
 
-#     def __init__(self, bigwig_file):
-#         from genomelake.extractors import BigwigExtractor
+        with self._lock:
+            if self._bw is not None and self._pid == os.getpid():
+                return self._bw
+            bw = pyBigWig.open(self.bigwig_file)
+            if bw is None:
+                raise IOError("Unable to open the bigwig file: {}".format(self.bigwig_file))
+            self._bw = bw
+            self._pid = os.getpid()
+            self.chroms = bw.chroms()
+            return bw
 
-#         self.bigwig_file = bigwig_file
-#         self.batch_extractor = BigwigExtractor(self.bigwig_file)
+    def _read_block(self, chrom, block):
+        if self._bw is None or self._pid != os.getpid():
+            self._open()
+        start = block * self.block_size
+        end = min(start + self.block_size, self.chroms[chrom])
+        # pyBigWig file handles can't be shared across threads
+        with self._lock:
+            return self._bw.values(chrom, start, end, numpy=True).astype(np.float32)
 
-#     def extract(self, interval):
-#         return self.batch_extractor([interval])[0]
+    def _get_block(self, chrom, block):
+        return self.cache.get_or_compute((chrom, block), lambda: self._read_block(chrom, block))
+
+    def _fill(self, chrom, start, end, out):
+        """Write the base-resolution signal of `[start, end)` to `out`
+        """
+        if chrom not in self.chroms:
+            raise KeyError("Requested chromosome {} does not exist in the bigwig file".format(chrom))
+        out[:] = np.nan
+        # only the part overlapping the chromosome
+        first, last = max(start, 0), min(end, self.chroms[chrom])
+        if first >= last:
+            # the interval lies outside of the chromosome
+            return out
+        for block in range(first // self.block_size, -(-last // self.block_size)):
+            block_start = block * self.block_size
+            values = self._get_block(chrom, block)
+            lo, hi = max(first, block_start), min(last, block_start + len(values))
+            if hi <= lo:
+                continue
+            out[lo - start:hi - start] = values[lo - block_start:hi - block_start]
+        return out
+
+    def get_output_len(self, seqlen):
+        if self.bin_size is None:
+            return seqlen
+        if seqlen % self.bin_size != 0:
+            raise ValueError("Interval length {} is not divisible by bin_size {}".format(seqlen, self.bin_size))
+        return seqlen // self.bin_size
+
+    def extract(self, interval):
+        return self.extract_batch([interval])[0]
 
-#     def close(self):
-#         return self.batch_extractor.close()
+    def extract_batch(self, intervals, out=None):
+        """Extract the signal of equal-length intervals
+
+        # Arguments
+          intervals: list of pybedtools.Interval of the same length
+          out: (optional) pre-allocated float32 array of shape `(len(intervals), self.get_output_len(L))`
+
+        # Returns
+          float32 array of shape `(len(intervals), L)` or `(len(intervals), L // bin_size)` if binned
+        """
+        seqlen = intervals[0].stop - intervals[0].start if len(intervals) else 0
+        shape = (len(intervals), self.get_output_len(seqlen))
+        if out is None:
+            out = np.empty(shape, dtype=np.float32)
+        elif out.shape != shape:
+            raise ValueError("out has the wrong shape: {}. Expected: {}".format(out.shape, shape))
+
+        values = out if self.bin_size is None else np.empty((len(intervals), seqlen), dtype=np.float32)
+        for i, interval in enumerate(intervals):
+            if interval.stop - interval.start != seqlen:
+                raise ValueError("All the intervals need to have the same length")
+            self._fill(interval.chrom, interval.start, interval.stop, values[i])
+        if self.nan_value is not None:
+            np.nan_to_num(values, copy=False, nan=self.nan_value)
+        if self.bin_size is not None:
+            values.reshape((len(intervals), -1, self.bin_size)).mean(axis=-1, out=out)
+        return out
+
+    def __getstate__(self):
+        # the file is re-opened lazily by the new process
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        state["_bw"] = None
+        state["_pid"] = None
+        state["cache"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self.cache = LRUCache(self.cache_max_bytes)
+
+    def close(self):
+        if getattr(self, "_lock", None) is None:
+            return
+        with self._lock:
+            if self._bw is not None:
+                self._bw.close()
+                self._bw = None
@@ -0,0 +1,107 @@
+import os
+import threading
+import zlib
+
+import numpy as np
+from kipoiseq.transforms.transforms import LRUCache
+
+__all__ = ["BgzfBlockReader"]
+
+
+class BgzfBlockReader(object):
+    """Random access to the uncompressed content of a BGZF (bgzip) file
+
+    Decompressed blocks are kept in a `LRUCache` bounded by `cache_max_bytes`, so
+    neighbouring reads don't decompress the same block again. `prefetch` decompresses
+    all the blocks required by a batch of reads in a thread pool (zlib releases the GIL).
+    Compressed blocks are read with positional reads, so the reader is thread-safe.
+
+    # Arguments
+      path: path to the BGZF file
+      block_offsets: list of `(compressed offset, uncompressed offset)` of each block,
+        e.g. the `gzi_index` of `pyfaidx.Faidx`
+      cache_max_bytes: maximum total size of the decompressed blocks kept in memory
+      num_threads: number of threads used to decompress the blocks in `prefetch`
+    """
+
+    def __init__(self, path, block_offsets, cache_max_bytes=2 ** 26, num_threads=1):
+        self.path = path
+        self.num_threads = num_threads
+        block_offsets = sorted(block_offsets)
+        self._cstarts = np.array([c for c, u in block_offsets] + [os.path.getsize(path)], dtype=np.int64)
+        self._ustarts = np.array([u for c, u in block_offsets], dtype=np.int64)
+        self.cache = LRUCache(cache_max_bytes)
+        self._file = open(path, "rb")
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _pread(self, length, offset):
+        if hasattr(os, "pread"):
+            return os.pread(self._file.fileno(), length, offset)
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def _decompress(self, i):
+        cstart, cend = self._cstarts[i], self._cstarts[i + 1]
+        # a single gzip member, trailing data (e.g. the EOF marker block) is ignored
+        data = zlib.decompressobj(zlib.MAX_WBITS | 16).decompress(self._pread(int(cend - cstart), int(cstart)))
+        return np.frombuffer(data, dtype=np.uint8)
+
+    def _get_block(self, i, blocks=None):
+        if blocks is not None and i in blocks:
+            return blocks[i]
+        return self.cache.get_or_compute(i, lambda: self._decompress(i))
+
+    def _block_range(self, offset, length):
+        first = np.searchsorted(self._ustarts, offset, side="right") - 1
+        last = np.searchsorted(self._ustarts, offset + length - 1, side="right") - 1
+        return range(max(first, 0), last + 1)
+
+    def prefetch(self, ranges):
+        """Decompress all the blocks overlapping the `(offset, length)` ranges
+
+        # Returns
+          dict of block index -> decompressed block, to be passed to `read`
+          (blocks may already be evicted from the cache for large batches)
+        """
+        needed = sorted(set(i for offset, length in ranges if length > 0
+                            for i in self._block_range(offset, length)))
+        blocks = {}
+        missing = []
+        for i in needed:
+            block = self.cache.get(i)
+            if block is None:
+                missing.append(i)
+            else:
+                blocks[i] = block
+        if len(missing) > 1 and self.num_threads > 1:
+            if self._pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._pool = ThreadPoolExecutor(self.num_threads)
+            decompressed = list(self._pool.map(self._decompress, missing))
+        else:
+            decompressed = [self._decompress(i) for i in missing]
+        for i, block in zip(missing, decompressed):
+            blocks[i] = self.cache.put(i, block)
+        return blocks
+
+    def read(self, offset, length, blocks=None):
+        """Read `length` uncompressed bytes starting at the uncompressed `offset`
+
+        # Arguments
+          blocks: (optional) blocks returned by `prefetch`
+        """
+        if length <= 0:
+            return b''
+        block_range = self._block_range(offset, length)
+        data = [self._get_block(i, blocks) for i in block_range]
+        data = data[0] if len(data) == 1 else np.concatenate(data)
+        start = offset - self._ustarts[block_range[0]]
+        return data[start:start + length].tobytes()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self._file.close()
@@ -0,0 +1,192 @@
+import json
+import os
+
+import numpy as np
+from kipoiseq.extractors.base import BaseExtractor
+from kipoiseq.transforms import functional as F
+
+__all__ = ["convert_fasta_to_memmap", "MemmapFastaExtractor"]
+
+MANIFEST = "manifest.json"
+
+# number of bases converted at once (multiple of 8 to keep the packed
+# data and mask byte-aligned)
+CHUNK_SIZE = 2 ** 24
+
+# same complement table as pyfaidx.complement
+_COMPLEMENT_TABLE = np.arange(256, dtype=np.uint8)
+_COMPLEMENT_TABLE[np.frombuffer(b"ACTGNactgnYRWSKMDVHBXyrwskmdvhbx", dtype=np.uint8)] = \
+    np.frombuffer(b"TGACNtgacnRYWSMKHBDVXrywsmkhbdvx", dtype=np.uint8)
+
+
+def reverse_complement_bytes(arr):
+    """Reverse-complement an array of ascii codes (uint8)
+    """
+    return _COMPLEMENT_TABLE[arr[::-1]]
+
+
+def convert_fasta_to_memmap(fasta_file, output_dir, packed=False):
+    """Convert the fasta file into a directory of per-chromosome binary files
+
+    The files can be memory-mapped by `MemmapFastaExtractor`. Since the OS page cache
+    is shared, all the processes on a node reading the same store share the memory.
+
+    # Arguments
+      fasta_file: path to the fasta file
+      output_dir: directory to which the store is written
+      packed: if True, store 2 bits per base (see `kipoiseq.transforms.functional.PackedSeq`).
+        Lower-case letters are converted to upper-case and non-ACGT bases to N.
+        Otherwise, the raw bytes (1 byte per base) are stored.
+
+    # Returns
+      dict: manifest describing the store
+    """
+    from pyfaidx import Fasta
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    manifest = {"format": "2bit" if packed else "uint8",
+                "fasta_file": os.path.abspath(fasta_file),
+                "chromosomes": {}}
+    fasta = Fasta(fasta_file)
+    try:
+        for i, chrom in enumerate(fasta.keys()):
+            length = fasta.faidx.index[chrom].rlen
+            path = os.path.join(output_dir, str(i))
+            extensions = [".2bit", ".mask"] if packed else [".bin"]
+            files = [open(path + ext, "wb") for ext in extensions]
+            try:
+                # write chunk-wise, so that at most one chunk is held in memory
+                for start in range(0, length, CHUNK_SIZE):
+                    seq = str(fasta[chrom][start:min(start + CHUNK_SIZE, length)])
+                    if packed:
+                        packed_seq = F.string2packed(seq)
+                        chunks = [packed_seq.data, packed_seq.mask]
+                    else:
+                        chunks = [seq.encode("ascii")]
+                    for f, chunk in zip(files, chunks):
+                        f.write(bytes(chunk))
+            finally:
+                for f in files:
+                    f.close()
+            manifest["chromosomes"][chrom] = {"file": str(i), "length": length}
+    finally:
+        fasta.close()
+
+    with open(os.path.join(output_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class BaseArrayFastaExtractor(BaseExtractor):
+    """Base class for the extractors reading the genome from uint8 arrays
+
+    Subclasses set `manifest`, `packed`, `use_strand`, `force_upper` and implement `_get_arrays`.
+    """
+
+    def _get_arrays(self, chrom):
+        """Return the tuple `(data,)` for the uint8 format or `(data, mask)` for the 2bit format
+        """
+        raise NotImplementedError
+
+    def _read_array(self, chrom, start, end):
+        """Ascii codes (uint8) of the sequence `[start, end)` (0-based), clipped to the chromosome
+        """
+        length = self.manifest["chromosomes"].get(chrom, {}).get("length", 0)
+        start = min(max(start, 0), length)
+        end = min(max(end, start), length)
+        if self.packed:
+            data, mask = self._get_arrays(chrom)
+            return F._codes2chars(*F._unpack_range(data, mask, start, end))
+        return self._get_arrays(chrom)[0][start:end]
+
+    def extract_array(self, interval):
+        """Extract the sequence as an array of ascii codes (uint8)
+
+        Returns a read-only view into the underlying buffer for the uint8 format
+        unless the sequence needs to be reverse-complemented or upper-cased.
+        """
+        arr = self._read_array(interval.chrom, interval.start, interval.stop)
+        if self.force_upper and not self.packed:
+            # a-z -> A-Z
+            arr = np.where((arr >= ord("a")) & (arr <= ord("z")), arr - 32, arr).astype(np.uint8)
+        if self.use_strand and interval.strand == "-":
+            arr = reverse_complement_bytes(arr)
+        return arr
+
+    def extract_packed(self, interval):
+        """Extract the sequence as `PackedSeq` (see `kipoiseq.transforms.functional.PackedSeq`)
+
+        For the 2bit format, the packed store is sliced without unpacking. The slice is
+        a read-only view into the underlying buffer if the interval starts at a multiple
+        of 8 and doesn't need to be reverse-complemented.
+        """
+        if not self.packed:
+            return F._chars2packed(self.extract_array(interval))
+        length = self.manifest["chromosomes"].get(interval.chrom, {}).get("length", 0)
+        start = min(max(interval.start, 0), length)
+        end = min(max(interval.stop, start), length)
+        data, mask = self._get_arrays(interval.chrom)
+        rc = self.use_strand and interval.strand == "-"
+        if start % 8 == 0 and not rc:
+            return F.PackedSeq(data[start // 4:-(-end // 4)], mask[start // 8:-(-end // 8)], end - start)
+        codes, mask = F._unpack_range(data, mask, start, end)
+        if rc:
+            # A <-> T, C <-> G
+            codes, mask = 3 - codes[::-1], mask[::-1]
+        return F._pack_codes(codes, mask)
+
+    def extract(self, interval):
+        return self.extract_array(interval).tobytes().decode("ascii")
+
+
+class MemmapFastaExtractor(BaseArrayFastaExtractor):
+    """Extractor for the genome store created by `convert_fasta_to_memmap`
+
+    Chromosomes are memory-mapped lazily. For the uint8 store, `extract_array`
+    returns zero-copy slices of the memory-mapped file.
+
+    # Arguments
+      store_dir: directory created by `convert_fasta_to_memmap`
+      use_strand (bool): if True, the extracted sequence
+        is reverse complemented in case interval.strand == "-"
+      force_upper (bool): Force uppercase output
+    """
+
+    def __init__(self, store_dir, use_strand=False, force_upper=False):
+        self.store_dir = store_dir
+        self.use_strand = use_strand
+        self.force_upper = force_upper
+        with open(os.path.join(store_dir, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.packed = self.manifest["format"] == "2bit"
+        self._arrays = {}
+
+    def _memmap(self, path, length):
+        if length == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.memmap(path, dtype=np.uint8, mode="r", shape=(length,))
+
+    def _get_arrays(self, chrom):
+        if chrom not in self._arrays:
+            try:
+                info = self.manifest["chromosomes"][chrom]
+            except KeyError:
+                raise KeyError("Requested chromosome {} does not exist in the store".format(chrom))
+            path = os.path.join(self.store_dir, info["file"])
+            length = info["length"]
+            if self.packed:
+                self._arrays[chrom] = (self._memmap(path + ".2bit", -(-length // 4)),
+                                       self._memmap(path + ".mask", -(-length // 8)))
+            else:
+                self._arrays[chrom] = (self._memmap(path + ".bin", length),)
+        return self._arrays[chrom]
+
+    def __getstate__(self):
+        # memory-maps are re-opened lazily in the new process
+        state = self.__dict__.copy()
+        state["_arrays"] = {}
+        return state
+
+    def close(self):
+        self._arrays = {}
@@ -0,0 +1,142 @@
+import numpy as np
+from kipoiseq.extractors.base import BaseExtractor, FastaStringExtractor
+from kipoiseq.extractors.memmap import BaseArrayFastaExtractor, _COMPLEMENT_TABLE
+from kipoiseq.transforms import functional as F
+from kipoiseq.transforms.transforms import ReorderedOneHot
+from kipoiseq.utils import DNA
+
+__all__ = ["FastaOneHotExtractor"]
+
+
+def _get_case_folded_token_table(alphabet, neutral_alphabet):
+    """Token table additionally mapping the lower-case letters to the tokens of upper-case letters
+    """
+    table = F._get_token_table(tuple(alphabet), tuple(neutral_alphabet)).copy()
+    lower = np.arange(ord("a"), ord("z") + 1)
+    unknown = table[lower] == F._UNKNOWN_TOKEN
+    table[lower[unknown]] = table[lower[unknown] - 32]
+    return table
+
+
+class FastaOneHotExtractor(BaseExtractor):
+    """Extract one-hot encoded sequences directly from the fasta file
+
+    The raw bytes of the interval are encoded into the output array without
+    creating intermediate python strings. Upper- and lower-case letters are
+    encoded the same way and the reverse-complementing is done in the same pass.
+
+    # Arguments
+      fasta_file: path to the fasta_file or the extractor to read the raw sequence from
+        (`FastaStringExtractor`, `MemmapFastaExtractor` or `SharedMemoryFastaExtractor`).
+        The strand and case options of the extractor are ignored and the extractor
+        is not closed by `close`.
+      use_strand (bool): if True, the extracted sequence
+        is reverse complemented in case interval.strand == "-"
+      alphabet: alphabet to use for the one-hot encoding. This defines the order of the one-hot encoding.
+          Can either be a list or a string: 'ACGT' or ['A, 'C', 'G', 'T']
+      neutral_alphabet: (single string character) neutral element representing
+      neutral_value: value of the neutral element
+      dtype: defines the numpy dtype of the returned array.
+      alphabet_axis: axis along which the alphabet runs (e.g. A,C,G,T for DNA)
+      dummy_axis: defines in which dimension a dummy axis should be added. None if no dummy axis is required.
+    """
+
+    def __init__(self, fasta_file, use_strand=False, alphabet=DNA, neutral_alphabet='N',
+                 neutral_value=0.25, dtype=None, alphabet_axis=1, dummy_axis=None):
+        if isinstance(fasta_file, BaseExtractor):
+            self.fasta_extractor = fasta_file
+            self._owns_extractor = False
+        else:
+            self.fasta_extractor = FastaStringExtractor(fasta_file)
+            self._owns_extractor = True
+        self.use_strand = use_strand
+        self.one_hot = ReorderedOneHot(alphabet=alphabet,
+                                       neutral_alphabet=neutral_alphabet,
+                                       neutral_value=neutral_value,
+                                       dtype=dtype,
+                                       alphabet_axis=alphabet_axis,
+                                       dummy_axis=dummy_axis)
+        if isinstance(neutral_alphabet, str):
+            neutral_alphabet = [neutral_alphabet]
+        self._table = _get_case_folded_token_table(self.one_hot.alphabet, neutral_alphabet)
+        # complement first, then tokenize
+        self._rc_table = self._table[_COMPLEMENT_TABLE]
+
+    def get_output_shape(self, seqlen=None):
+        return self.one_hot.get_output_shape(seqlen)
+
+    def _read_codes(self, interval):
+        if isinstance(self.fasta_extractor, BaseArrayFastaExtractor):
+            return self.fasta_extractor._read_array(interval.chrom, interval.start, interval.stop)
+        return np.frombuffer(self.fasta_extractor._read_bytes(interval.chrom, interval.start, interval.stop),
+                             dtype=np.uint8)
+
+    def _tokenize_into(self, codes, strand, out):
+        """Tokenize the ascii codes into `out` (1D array of the same length)
+        """
+        # codes are always in range, mode='clip' avoids buffering the output
+        if self.use_strand and strand == "-":
+            np.take(self._rc_table, codes[::-1], out=out, mode='clip')
+        else:
+            np.take(self._table, codes, out=out, mode='clip')
+        if len(out) and out.min() == F._UNKNOWN_TOKEN:
+            raise KeyError(chr(codes[out == F._UNKNOWN_TOKEN][0]))
+        return out
+
+    def extract_tokens(self, interval):
+        """Extract the sequence as an array of tokens. Neutral letters are encoded as -1
+
+        As for `FastaStringExtractor`, the sequence is truncated at the chromosome end.
+        """
+        codes = self._read_codes(interval)
+        return self._tokenize_into(codes, interval.strand,
+                                   np.empty(len(codes), dtype=self._table.dtype))
+
+    def extract_tokens_batch(self, intervals, out=None):
+        """Extract the sequences of equal-length intervals as a (N, L) array of tokens
+
+        # Arguments
+          intervals: list of pybedtools.Interval of the same length
+          out: (optional) pre-allocated integer array of shape `(len(intervals), L)`
+        """
+        seqlen = intervals[0].stop - intervals[0].start if len(intervals) else 0
+        if out is None:
+            out = np.empty((len(intervals), seqlen), dtype=self._table.dtype)
+        elif out.shape != (len(intervals), seqlen):
+            raise ValueError("out has the wrong shape: {}. Expected: {}".format(
+                out.shape, (len(intervals), seqlen)))
+        for i, interval in enumerate(intervals):
+            codes = self._read_codes(interval)
+            if len(codes) != seqlen:
+                raise ValueError("Sequence of the interval {}:{}-{} is not of length {}".format(
+                    interval.chrom, interval.start, interval.stop, seqlen))
+            self._tokenize_into(codes, interval.strand, out[i])
+        return out
+
+    def extract(self, interval, out=None):
+        """Extract the one-hot encoded sequence
+
+        # Arguments
+          interval: pybedtools.Interval
+          out: (optional) pre-allocated array of shape `self.get_output_shape(len(interval))`
+        """
+        tokens = self.extract_tokens(interval)
+        return self.one_hot._encode(tokens, out)
+
+    def extract_batch(self, intervals, out=None):
+        """Extract the one-hot encoded sequences of equal-length intervals
+
+        # Arguments
+          intervals: list of pybedtools.Interval of the same length
+          out: (optional) pre-allocated array of shape `(len(intervals),) + self.get_output_shape(L)`
+            which can be re-used across batches
+
+        # Returns
+          Array of shape `(len(intervals),) + self.get_output_shape(L)`, i.e. (N, L, 4) by default
+        """
+        tokens = self.extract_tokens_batch(intervals)
+        return self.one_hot._encode(tokens, out)
+
+    def close(self):
+        if getattr(self, "_owns_extractor", False):
+            return self.fasta_extractor.close()
@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+import weakref
+
+import numpy as np
+from kipoiseq.extractors.memmap import CHUNK_SIZE, BaseArrayFastaExtractor
+from kipoiseq.transforms import functional as F
+
+__all__ = ["SharedMemoryFastaExtractor"]
+
+# layout of the segment: [uint64 header size][json header][padding][chromosome data]
+_HEADER_SIZE_BYTES = 8
+_ALIGN = 8
+
+
+def _align(n):
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def _array_sizes(length, packed):
+    """Sizes of the arrays holding a chromosome of the given length
+    """
+    return [-(-length // 4), -(-length // 8)] if packed else [length]
+
+
+_register_lock = threading.Lock()
+
+
+def _attach_shared_memory(name):
+    """Attach to an existing segment without registering it with the resource tracker
+
+    Otherwise, the resource tracker of the attaching process would unlink
+    the segment when the process exits.
+    """
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13. The resource tracker may be shared with the creating process
+        # (e.g. for multiprocessing workers), so the segment is not registered at all
+        # instead of unregistering it after attaching.
+        from multiprocessing import resource_tracker
+        with _register_lock:
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                return shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+
+
+def _release_segment(shm, owner_pid):
+    """Close the segment and unlink it if called in the creating process
+    """
+    try:
+        shm.close()
+    except BufferError:
+        # views of the segment are still referenced elsewhere
+        pass
+    if owner_pid == os.getpid():
+        shm.unlink()
+
+
+class SharedMemoryFastaExtractor(BaseArrayFastaExtractor):
+    """Fasta extractor backed by a shared memory segment
+
+    The reference genome is read once into a `multiprocessing.shared_memory` segment
+    by the creating process. Other processes (e.g. dataloader workers) attach to the
+    segment by name, either explicitly using `SharedMemoryFastaExtractor.attach(name)`
+    or implicitly when the extractor is pickled. This way, the genome is held in
+    memory only once irrespective of the number of workers.
+
+    The segment is unlinked when the creating extractor is closed or garbage collected
+    (or at the latest when the interpreter exits).
+
+    # Arguments
+      fasta_file: path to the fasta file
+      use_strand (bool): if True, the extracted sequence
+        is reverse complemented in case interval.strand == "-"
+      force_upper (bool): Force uppercase output
+      packed: if True, store 2 bits per base (see `kipoiseq.transforms.functional.PackedSeq`).
+        Lower-case letters are converted to upper-case and non-ACGT bases to N.
+      name: name of the shared memory segment. If None, a random name is chosen.
+    """
+
+    def __init__(self, fasta_file, use_strand=False, force_upper=False, packed=False, name=None):
+        from multiprocessing import shared_memory
+        from pyfaidx import Fasta
+
+        self.use_strand = use_strand
+        self.force_upper = force_upper
+        self.packed = packed
+
+        manifest = {"format": "2bit" if packed else "uint8",
+                    "fasta_file": os.path.abspath(fasta_file),
+                    "chromosomes": {}}
+        fasta = Fasta(fasta_file)
+        try:
+            # lay out the segment using the chromosome lengths of the index
+            offset = 0
+            for chrom in fasta.keys():
+                length = fasta.faidx.index[chrom].rlen
+                offsets = []
+                for size in _array_sizes(length, packed):
+                    offsets.append(offset)
+                    offset = _align(offset + size)
+                manifest["chromosomes"][chrom] = {"offsets": offsets, "length": length}
+
+            header = json.dumps(manifest).encode("utf-8")
+            data_offset = _align(_HEADER_SIZE_BYTES + len(header))
+            self._shm = shared_memory.SharedMemory(name=name, create=True,
+                                                   size=max(data_offset + offset, 1))
+            buf = self._shm.buf
+            buf[:_HEADER_SIZE_BYTES] = np.uint64(len(header)).tobytes()
+            buf[_HEADER_SIZE_BYTES:_HEADER_SIZE_BYTES + len(header)] = header
+
+            # copy the chromosomes chunk-wise into the segment, so that at most
+            # one chunk is held in private memory
+            for chrom, info in manifest["chromosomes"].items():
+                length = info["length"]
+                for start in range(0, length, CHUNK_SIZE):
+                    end = min(start + CHUNK_SIZE, length)
+                    seq = str(fasta[chrom][start:end])
+                    if packed:
+                        packed_seq = F.string2packed(seq)
+                        chunks = [(packed_seq.data, start // 4), (packed_seq.mask, start // 8)]
+                    else:
+                        chunks = [(seq.encode("ascii"), start)]
+                    for (chunk, chunk_offset), arr_offset in zip(chunks, info["offsets"]):
+                        pos = data_offset + arr_offset + chunk_offset
+                        buf[pos:pos + len(chunk)] = bytes(chunk)
+        except BaseException:
+            shm = getattr(self, "_shm", None)
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            raise
+        finally:
+            fasta.close()
+
+        self.name = self._shm.name
+        self.manifest = manifest
+        self._data_offset = data_offset
+        self._owner_pid = os.getpid()
+        self._arrays = {}
+        # unlink the segment once the extractor is garbage collected
+        self._finalizer = weakref.finalize(self, _release_segment, self._shm, self._owner_pid)
+
+    @classmethod
+    def attach(cls, name, use_strand=False, force_upper=False):
+        """Attach to a segment created by another `SharedMemoryFastaExtractor`
+
+        # Arguments
+          name: name of the shared memory segment
+          use_strand (bool): if True, the extracted sequence
+            is reverse complemented in case interval.strand == "-"
+          force_upper (bool): Force uppercase output
+        """
+        self = cls.__new__(cls)
+        self.name = name
+        self.use_strand = use_strand
+        self.force_upper = force_upper
+        self._owner_pid = None
+        self._finalizer = None
+        self._attach()
+        return self
+
+    def _attach(self):
+        self._shm = _attach_shared_memory(self.name)
+        buf = self._shm.buf
+        header_size = int(np.frombuffer(buf[:_HEADER_SIZE_BYTES], dtype=np.uint64)[0])
+        self.manifest = json.loads(bytes(buf[_HEADER_SIZE_BYTES:_HEADER_SIZE_BYTES + header_size]))
+        self.packed = self.manifest["format"] == "2bit"
+        self._data_offset = _align(_HEADER_SIZE_BYTES + header_size)
+        self._arrays = {}
+
+    def _get_arrays(self, chrom):
+        if self._shm is None:
+            self._attach()
+        if chrom not in self._arrays:
+            try:
+                info = self.manifest["chromosomes"][chrom]
+            except KeyError:
+                raise KeyError("Requested chromosome {} does not exist in the shared memory".format(chrom))
+            arrays = []
+            for offset, size in zip(info["offsets"], _array_sizes(info["length"], self.packed)):
+                arr = np.frombuffer(self._shm.buf, dtype=np.uint8, count=size,
+                                    offset=self._data_offset + offset)
+                arr.flags.writeable = False
+                arrays.append(arr)
+            self._arrays[chrom] = tuple(arrays)
+        return self._arrays[chrom]
+
+    def __getstate__(self):
+        # the unpickled extractor attaches to the segment by name and never owns it
+        state = self.__dict__.copy()
+        state["_shm"] = None
+        state["_arrays"] = {}
+        state["_owner_pid"] = None
+        state["_finalizer"] = None
+        return state
+
+    @property
+    def is_owner(self):
+        """True if this extractor created the segment (in the current process)
+        """
+        return self._owner_pid == os.getpid()
+
+    def close(self):
+        shm = getattr(self, "_shm", None)
+        if shm is None:
+            return
+        # numpy views have to be released before the buffer can be closed
+        self._arrays = {}
+        self._shm = None
+        if self.is_owner and self._finalizer is not None:
+            self._finalizer()
+        else:
+            _release_segment(shm, None)
+        self._owner_pid = None
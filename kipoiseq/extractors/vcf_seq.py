@@ -1,8 +1,14 @@
 from collections import defaultdict
+from itertools import repeat
+from numbers import Integral
+import numpy as np
 from tqdm import tqdm
 from pybedtools import Interval
-from pyfaidx import Sequence, complement
+from pyfaidx import complement
 from kipoiseq.extractors import BaseExtractor, FastaStringExtractor
+from kipoiseq.extractors.one_hot import _get_case_folded_token_table
+from kipoiseq.transforms import functional as F
+from kipoiseq.utils import DNA, parse_alphabet, parse_dtype
 try:
     from cyvcf2 import VCF
 except ImportError:
@@ -16,6 +22,7 @@ def variant_to_id(variant):
 
 __all__ = [
     'VariantSeqExtractor',
+    'VariantOneHotExtractor',
     'MultiSampleVCF',
     'SingleVariantVCFSeqExtractor',
     'SingleSeqVCFSeqExtractor'
@@ -334,39 +341,30 @@ class MultiSampleVCF(VCF):
 
 class IntervalSeqBuilder(list):
     """
-    String builder for `pyfaidx.Sequence` and `Interval` objects.
+    Sequence builder splicing alleles into the reference sequence.
+
+    Each item is a tuple `(alt, start, end)`: the allele `alt` (bytes)
+    followed by the reference sequence `[start, end)` (0-based). Ranges
+    with `end < start` are empty.
     """
 
-    def restore(self, sequence):
-        """
-        Args:
-          seq: `pyfaidx.Sequence` which convert all interval inside
-            to `Seqeunce` objects.
+    def concat(self, reference, reference_start):
         """
-        for i, interval in enumerate(self):
-            # interval.end can be bigger than interval.start
-            interval_len = max(0, interval.end - interval.start)
-
-            if type(self[i]) == Interval:
-                start = interval.start - sequence.start
-                end = start + interval_len
-                self[i] = sequence[start: end]
-
-    def _concat(self):
-        for sequence in self:
-            if type(sequence) != Sequence:
-                raise TypeError('Intervals should be restored with `restore`'
-                                ' method before calling concat method!')
-            yield sequence.seq
+        Build the sequence from the reference.
 
-    def concat(self):
-        """
-        Build the string from sequence objects.
+        Args:
+          reference: reference sequence (bytes) starting at `reference_start`
+          reference_start: 0-based position of the first reference base
 
         Returns:
-          str: the final sequence.
+          bytearray: the final sequence.
         """
-        return ''.join(self._concat())
+        seq = bytearray()
+        for alt, start, end in self:
+            seq += alt
+            offset = start - reference_start
+            seq += reference[offset:offset + max(0, end - start)]
+        return seq
 
 
 class VariantSeqExtractor(BaseExtractor):
@@ -398,7 +396,21 @@ class VariantSeqExtractor(BaseExtractor):
         # Preprocessing
         anchor = max(min(anchor, interval.end), interval.start)
         variant_pairs = self._variant_to_sequence(variants)
+        upstream_variants, downstream_variants = self._split_variants(
+            interval, variant_pairs, anchor, fixed_len)
+        istart, iend = self._window(
+            interval, upstream_variants, downstream_variants, fixed_len)
+
+        # fetch the reference sequence once and splice the variants in
+        reference = self._fetch(interval, istart, iend)
+        return self._splice(reference, istart, interval, upstream_variants,
+                            downstream_variants, anchor, istart, iend, fixed_len)
 
+    def _split_variants(self, interval, variant_pairs, anchor, fixed_len):
+        """
+        Split the variants into upstream and downstream of the anchor,
+        each sorted by the distance to the anchor.
+        """
         # 1. Split variants overlapping with anchor
         # and interval start end if not fixed_len
         variant_pairs = self._split_overlapping(variant_pairs, anchor)
@@ -409,93 +421,159 @@ class VariantSeqExtractor(BaseExtractor):
             variant_pairs = self._split_overlapping(
                 variant_pairs, interval.end, which='left')
 
-        variant_pairs = list(variant_pairs)
-
         # 2. split the variants into upstream and downstream
         # and sort the variants in each interval
         upstream_variants = sorted(
-            filter(lambda x: x[0].start >= anchor, variant_pairs),
-            key=lambda x: x[0].start)
+            [x for x in variant_pairs if x[0] >= anchor],
+            key=lambda x: x[0])
 
         downstream_variants = sorted(
-            filter(lambda x: x[0].start < anchor, variant_pairs),
-            key=lambda x: x[0].start, reverse=True)
+            [x for x in variant_pairs if x[0] < anchor],
+            key=lambda x: x[0], reverse=True)
+        return upstream_variants, downstream_variants
 
+    def _window(self, interval, upstream_variants, downstream_variants, fixed_len):
+        """
+        Reference region required to build the sequence.
+        """
         # 3. Extend start and end position for deletions
         if fixed_len:
-            istart, iend = self._updated_interval(
+            return self._updated_interval(
                 interval, upstream_variants, downstream_variants)
-        else:
-            istart, iend = interval.start, interval.end
+        return interval.start, interval.end
 
+    def _splice(self, reference, reference_start, interval, upstream_variants,
+                downstream_variants, anchor, istart, iend, fixed_len):
+        """
+        Apply the variants to the reference sequence (bytes starting at
+        `reference_start` and covering `[istart, iend)`).
+        """
         # 4. Iterate from the anchor point outwards. At each
-        # register the interval from which to take the reference sequence
-        # as well as the interval for the variant
+        # register the region from which to take the reference sequence
+        # as well as the allele of the variant
         down_sb = self._downstream_builder(
             downstream_variants, interval, anchor, istart)
 
         up_sb = self._upstream_builder(
             upstream_variants, interval, anchor, iend)
 
-        # 5. fetch the sequence and restore intervals in builder
-        seq = self._fetch(interval, istart, iend)
-        up_sb.restore(seq)
-        down_sb.restore(seq)
-
-        # 6. Concate sequences from the upstream and downstream splits. Concat
+        # 5. Concate sequences from the upstream and downstream splits. Concat
         # upstream and downstream sequence. Cut to fix the length.
-        down_str = down_sb.concat()
-        up_str = up_sb.concat()
+        down_str = down_sb.concat(reference, reference_start)
+        up_str = up_sb.concat(reference, reference_start)
 
         if fixed_len:
             down_str, up_str = self._cut_to_fix_len(
                 down_str, up_str, interval, anchor)
 
-        seq = down_str + up_str
+        down_str += up_str
+        seq = down_str.decode()
 
         if interval.strand == '-':
             seq = complement(seq)[::-1]
 
         return seq
 
+    def extract_single_variants(self, interval, variants, anchor, fixed_len=True,
+                                return_ref=False):
+        """
+        Apply each variant separately. Same as calling `extract` with each
+        single variant, but the reference sequence is fetched only once
+        (with enough flank for the largest deletion).
+
+        Args:
+          interval: pybedtools.Interval Region of interest (see `extract`)
+          variants List[cyvcf2.Variant]: variants overlapping the `interval`.
+          anchor: see `extract`
+          fixed_len: see `extract`
+          return_ref: if True, also return the reference sequence of the interval
+
+        Returns:
+          list of sequences (`str`), one for each variant. If `return_ref`,
+          the tuple `(reference sequence, list of sequences)`.
+        """
+        anchor = max(min(anchor, interval.end), interval.start)
+        istart, iend = interval.start, interval.end
+        splits = []
+        for variant_pair in self._variant_to_sequence(variants):
+            upstream_variants, downstream_variants = self._split_variants(
+                interval, [variant_pair], anchor, fixed_len)
+            vstart, vend = self._window(
+                interval, upstream_variants, downstream_variants, fixed_len)
+            splits.append((upstream_variants, downstream_variants, vstart, vend))
+            istart, iend = min(istart, vstart), max(iend, vend)
+
+        if not splits and not return_ref:
+            return []
+        reference = self._fetch(interval, istart, iend)
+        seqs = [self._splice(reference, istart, interval, upstream_variants,
+                             downstream_variants, anchor, vstart, vend, fixed_len)
+                for upstream_variants, downstream_variants, vstart, vend in splits]
+        if return_ref:
+            ref_seq = self._splice(reference, istart, interval, [], [], anchor,
+                                   interval.start, interval.end, fixed_len)
+            return ref_seq, seqs
+        return seqs
+
+    def aextract_batch(self, intervals, variants, anchor, fixed_len=True,
+                       max_concurrency=16, executor=None):
+        """Extract the sequences of many intervals concurrently
+
+        Args:
+          intervals: iterable of pybedtools.Interval
+          variants: iterable of the variant lists of each interval
+          anchor: anchor (see `extract`) shared by all the intervals or an iterable
+            with an anchor for each interval
+          fixed_len: see `extract`
+          max_concurrency: maximum number of `extract` calls in flight
+          executor: concurrent.futures executor. If None, a thread pool with
+            `max_concurrency` threads is used.
+
+        Returns:
+          async generator yielding the sequences in the order of `intervals`
+        """
+        anchors = repeat(anchor) if isinstance(anchor, Integral) else anchor
+        return self._aextract_many(zip(intervals, variants, anchors),
+                                   max_concurrency=max_concurrency, executor=executor,
+                                   fixed_len=fixed_len)
+
     def _variant_to_sequence(self, variants):
         """
-        Convert `cyvcf2.Variant` objects to `pyfaidx.Seqeunce` objects
-        for reference and variants.
+        Convert `cyvcf2.Variant` objects to `(start, end, alt)` tuples where
+        `[start, end)` is the 0-based reference region and `alt` the
+        alternative allele (bytes).
         """
-        for v in variants:
-            ref = Sequence(name=v.CHROM, seq=v.REF,
-                           start=v.start, end=v.start + len(v.REF))
-            # TO DO: consider alternative alleles.
-            alt = Sequence(name=v.CHROM, seq=v.ALT[0],
-                           start=v.start, end=v.start + len(v.ALT[0]))
-            yield ref, alt
+        # TO DO: consider alternative alleles.
+        return [(v.start, v.start + len(v.REF), v.ALT[0].encode())
+                for v in variants]
 
     def _split_overlapping(self, variant_pairs, anchor, which='both'):
         """
         Split the variants hitting the anchor into two
         """
-        for ref, alt in variant_pairs:
-            if ref.start < anchor < ref.end:
-                mid = anchor - ref.start
+        split = []
+        for start, end, alt in variant_pairs:
+            if start < anchor < end:
+                mid = anchor - start
                 if which == 'left' or which == 'both':
-                    yield ref[:mid], alt[:mid]
+                    split.append((start, anchor, alt[:mid]))
                 if which == 'right' or which == 'both':
-                    yield ref[mid:], alt[mid:]
+                    split.append((anchor, end, alt[mid:]))
             else:
-                yield ref, alt
+                split.append((start, end, alt))
+        return split
 
     def _updated_interval(self, interval, up_variants, down_variants):
         istart = interval.start
         iend = interval.end
 
-        for ref, alt in up_variants:
-            diff_len = len(alt) - len(ref)
+        for start, end, alt in up_variants:
+            diff_len = len(alt) - (end - start)
             if diff_len < 0:
                 iend -= diff_len
 
-        for ref, alt in down_variants:
-            diff_len = len(alt) - len(ref)
+        for start, end, alt in down_variants:
+            diff_len = len(alt) - (end - start)
             if diff_len < 0:
                 istart += diff_len
 
@@ -505,13 +583,12 @@ class VariantSeqExtractor(BaseExtractor):
         down_sb = IntervalSeqBuilder()
 
         prev = anchor
-        for ref, alt in down_variants:
-            if ref.end <= istart:
+        for start, end, alt in down_variants:
+            if end <= istart:
                 break
-            down_sb.append(Interval(interval.chrom, ref.end, prev))
-            down_sb.append(alt)
-            prev = ref.start
-        down_sb.append(Interval(interval.chrom, istart, prev))
+            down_sb.append((alt, end, prev))
+            prev = start
+        down_sb.append((b'', istart, prev))
         down_sb.reverse()
 
         return down_sb
@@ -520,29 +597,184 @@ class VariantSeqExtractor(BaseExtractor):
         up_sb = IntervalSeqBuilder()
 
         prev = anchor
-        for ref, alt in up_variants:
-            if ref.start >= iend:
+        prev_alt = b''
+        for start, end, alt in up_variants:
+            if start >= iend:
                 break
-            up_sb.append(Interval(interval.chrom, prev, ref.start))
-            up_sb.append(alt)
-            prev = ref.end
-        up_sb.append(Interval(interval.chrom, prev, iend))
+            up_sb.append((prev_alt, prev, start))
+            prev_alt = alt
+            prev = end
+        up_sb.append((prev_alt, prev, iend))
 
         return up_sb
 
     def _fetch(self, interval, istart, iend):
-        seq = self.fasta.extract(Interval(interval.chrom, istart, iend))
-        seq = Sequence(name=interval.chrom, seq=seq, start=istart, end=iend)
+        if istart < 0:
+            # same exception as raised by pybedtools.Interval
+            raise OverflowError("Region {}:{}-{} starts before the chromosome start".format(
+                interval.chrom, istart, iend))
+        seq = self.fasta._read_bytes(interval.chrom, istart, iend)
+        if 0 < len(seq) < iend - istart:
+            raise ValueError("Region {}:{}-{} exceeds the chromosome end".format(
+                interval.chrom, istart, iend))
         return seq
 
     def _cut_to_fix_len(self,  down_str, up_str, interval, anchor):
         down_len = anchor - interval.start
         up_len = interval.end - anchor
-        down_str = down_str[-down_len:] if down_len else ''
-        up_str = up_str[: up_len] if up_len else ''
+        down_str = down_str[-down_len:] if down_len else bytearray()
+        up_str = up_str[: up_len] if up_len else bytearray()
         return down_str, up_str
 
 
+class VariantOneHotExtractor(BaseExtractor):
+    """
+    One-hot encoded reference and alternative sequences for variant effect
+    prediction.
+
+    The reference window is encoded once. The one-hot encoding of each
+    alternative sequence is a copy of the reference encoding in which only
+    the rows affected by the variant are patched: the allele for SNVs and,
+    for indels, additionally the half-window between the variant and the
+    interval end (upstream of the anchor) or start (downstream of the anchor)
+    which is shifted by the length difference of the alleles. The result is
+    the same as one-hot encoding the sequences of
+    `VariantSeqExtractor.extract_single_variants` with `fixed_len=True`.
+    """
+
+    def __init__(self, fasta_file, alphabet=DNA, neutral_alphabet='N',
+                 neutral_value=0.25, dtype=None):
+        """
+        Args:
+          fasta_file: path to the fasta file (can be gzipped)
+          alphabet: alphabet defining the order of the one-hot encoding
+          neutral_alphabet: letters encoded with `neutral_value`
+          neutral_value: value of the neutral letters
+          dtype: numpy dtype of the returned arrays
+        """
+        self.variant_extractor = VariantSeqExtractor(fasta_file)
+        self.alphabet = parse_alphabet(alphabet)
+        self.neutral_value = neutral_value
+        self.dtype = parse_dtype(dtype)
+        if isinstance(neutral_alphabet, str):
+            neutral_alphabet = [neutral_alphabet]
+        self._table = _get_case_folded_token_table(alphabet, neutral_alphabet)
+
+    def _encode(self, seq):
+        """
+        One-hot encode a sequence (bytes), lower-case letters included.
+        """
+        codes = np.frombuffer(bytes(seq), dtype=np.uint8)
+        tokens = self._table[codes]
+        if len(tokens) and tokens.min() == F._UNKNOWN_TOKEN:
+            raise KeyError(chr(codes[tokens == F._UNKNOWN_TOKEN][0]))
+        out = np.empty((len(tokens), len(self.alphabet)), dtype=self.dtype)
+        return F._one_hot_into(tokens, out, self.neutral_value)
+
+    def extract(self, interval, variants, anchor, out=None):
+        """
+        Args:
+          interval: pybedtools.Interval Region of interest
+            (see `VariantSeqExtractor.extract`)
+          variants List[cyvcf2.Variant]: variants overlapping the `interval`.
+            Each variant is applied separately.
+          anchor: see `VariantSeqExtractor.extract`
+          out: (optional) pre-allocated array for the alternative sequences
+            of shape `(len(variants), L, len(alphabet))`. It's filled with the
+            reverse-complemented sequences for intervals on the '-' strand.
+
+        Returns:
+          tuple `(ref, alt)` of arrays with shape
+          `(len(variants), L, len(alphabet))`. `ref` is a read-only view
+          repeating the encoded reference sequence of the interval.
+        """
+        ve = self.variant_extractor
+        anchor = max(min(anchor, interval.end), interval.start)
+        seqlen = interval.end - interval.start
+        istart, iend = interval.start, interval.end
+        splits = []
+        for variant_pair in ve._variant_to_sequence(variants):
+            upstream_variants, downstream_variants = ve._split_variants(
+                interval, [variant_pair], anchor, True)
+            vstart, vend = ve._window(
+                interval, upstream_variants, downstream_variants, True)
+            splits.append((upstream_variants, downstream_variants, vstart, vend))
+            istart, iend = min(istart, vstart), max(iend, vend)
+
+        reference = ve._fetch(interval, istart, iend)
+        if len(reference) != iend - istart:
+            raise ValueError("Region {}:{}-{} exceeds the chromosome end".format(
+                interval.chrom, istart, iend))
+        # encode the reference window once
+        ref_window = self._encode(reference)
+        ref = ref_window[interval.start - istart:interval.end - istart]
+
+        shape = (len(splits), seqlen, len(self.alphabet))
+        if out is None:
+            out = np.empty(shape, dtype=self.dtype)
+        elif out.shape != shape:
+            raise ValueError("out has the wrong shape: {}. Expected: {}".format(
+                out.shape, shape))
+        if interval.strand == '-':
+            # write the forward strand into a reverse-complemented view of `out`
+            alts = F.rc_one_hot(out, self.alphabet)
+            if not np.shares_memory(alts, out):
+                # the complement of the alphabet is not the reversed alphabet
+                alts = np.empty_like(out)
+        else:
+            alts = out
+        alts[...] = ref
+
+        down_len = anchor - interval.start
+        for alt, (upstream_variants, downstream_variants, vstart, vend) \
+                in zip(alts, splits):
+            down_sb = ve._downstream_builder(
+                downstream_variants, interval, anchor, vstart)
+            up_sb = ve._upstream_builder(
+                upstream_variants, interval, anchor, vend)
+            # the downstream sequence ends at the anchor,
+            # the upstream sequence starts at the anchor
+            row = down_len - sum(len(a) + max(0, end - start)
+                                 for a, start, end in down_sb)
+            for item in down_sb:
+                row = self._patch(alt, row, item, ref_window, istart, interval)
+            row = down_len
+            for item in up_sb:
+                row = self._patch(alt, row, item, ref_window, istart, interval)
+
+        if interval.strand == '-':
+            ref = F.rc_one_hot(ref, self.alphabet)
+            if not np.shares_memory(alts, out):
+                out[...] = F.rc_one_hot(alts, self.alphabet)
+        return np.broadcast_to(ref, shape), out
+
+    def _patch(self, alt, row, item, ref_window, reference_start, interval):
+        """
+        Write the builder item `(allele, start, end)` at `row` of the
+        alternative sequence `alt` (initialized with the reference sequence)
+        and return the row following it.
+        """
+        allele, start, end = item
+        if allele:
+            self._write(alt, row, self._encode(allele))
+            row += len(allele)
+        n = max(0, end - start)
+        # reference rows at their original position are already in place
+        if n and row != start - interval.start:
+            offset = start - reference_start
+            self._write(alt, row, ref_window[offset:offset + n])
+        return row + n
+
+    @staticmethod
+    def _write(alt, row, rows):
+        """
+        Write `rows` at `row` of `alt`, clipped to the sequence length.
+        """
+        lo, hi = max(row, 0), min(row + len(rows), len(alt))
+        if lo < hi:
+            alt[lo:hi] = rows[lo - row:hi - row]
+
+
 class BaseVCFSeqExtractor(BaseExtractor):
     """
     Base class to fetch sequence in which variants applied based
@@ -567,12 +799,43 @@ class SingleVariantVCFSeqExtractor(BaseVCFSeqExtractor):
     on given vcf file.
     """
 
-    def extract(self, interval, anchor=None, sample_id=None, fixed_len=True):
-        for variant in self.vcf.fetch_variants(interval, sample_id):
-            yield self.variant_extractor.extract(interval,
-                                                 variants=[variant],
-                                                 anchor=anchor,
-                                                 fixed_len=fixed_len)
+    def extract(self, interval, anchor=None, sample_id=None, fixed_len=True,
+                fetch_once=True, return_ref=False):
+        """
+        Args:
+          interval: pybedtools.Interval Region of interest
+          anchor: see `VariantSeqExtractor.extract`
+          sample_id (str, optional): only use the variants of this sample
+          fixed_len: see `VariantSeqExtractor.extract`
+          fetch_once: if True, the reference sequence is fetched once for
+            all the variants. Otherwise, once for each variant.
+          return_ref: if True, yield tuples `(reference sequence, sequence)`.
+
+        Yields:
+          the sequence with each single variant applied.
+        """
+        variants = self.vcf.fetch_variants(interval, sample_id)
+        if fetch_once:
+            seqs = self.variant_extractor.extract_single_variants(
+                interval, list(variants), anchor=anchor, fixed_len=fixed_len,
+                return_ref=return_ref)
+        else:
+            seqs = (self.variant_extractor.extract(interval,
+                                                   variants=[variant],
+                                                   anchor=anchor,
+                                                   fixed_len=fixed_len)
+                    for variant in variants)
+            if return_ref:
+                ref_seq = self.variant_extractor.extract(
+                    interval, variants=[], anchor=anchor, fixed_len=fixed_len)
+                seqs = ref_seq, seqs
+
+        if return_ref:
+            ref_seq, seqs = seqs
+            for seq in seqs:
+                yield ref_seq, seq
+        else:
+            yield from seqs
 
 
 class SingleSeqVCFSeqExtractor(BaseVCFSeqExtractor):
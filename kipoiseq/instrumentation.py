@@ -0,0 +1,209 @@
+"""Opt-in instrumentation of the extractors, the dataloaders and the caches
+
+When enabled, the methods listed below are wrapped to record the number of calls,
+the number of bytes returned, the number of cache hits, the total time and a latency
+histogram per stage. When disabled (default), the original methods are restored, so
+the instrumentation doesn't cost anything.
+
+Instrumented stages:
+  - `extract` and `extract_batch` of `BaseExtractor` and all its subclasses
+    (e.g. `FastaStringExtractor.extract`, `VariantSeqExtractor.extract`)
+  - `FastaStringExtractor._read_bytes`: all reads of the raw reference sequence,
+    including the reads of `VariantSeqExtractor`, `VariantOneHotExtractor` and
+    `FastaOneHotExtractor`. This separates the fasta I/O from the encoding.
+  - `MultiSampleVCF.fetch_variants`
+  - `__getitem__` of `BedDataset`, `StringSeqIntervalDl`, `SeqIntervalDl`
+    and `__next__` of `MMSpliceDl`
+  - `__call__` and `batch` of `OneHot` and `ReorderedOneHot`
+  - `LRUCache.get` (the cache hits are counted)
+
+The stats are recorded per process. With multiple dataloader workers, enable
+the instrumentation in each worker (it is inherited on fork), collect `get_stats()`
+from each worker and combine them with `merge_stats`.
+
+Example:
+```python
+from kipoiseq import instrumentation
+instrumentation.enable()
+...
+instrumentation.get_stats()["FastaStringExtractor.extract"]
+# {'calls': 10, 'bytes': 1000, 'cache_hits': 0, 'time': 0.001, 'latency_histogram': [...]}
+```
+"""
+import inspect
+import threading
+import time
+from copy import deepcopy
+from functools import wraps
+
+import numpy as np
+
+__all__ = ["enable", "disable", "is_enabled", "get_stats", "reset_stats", "merge_stats"]
+
+# bucket i of the latency histogram counts the calls taking [2^(i-1), 2^i) microseconds
+HISTOGRAM_BINS = 32
+
+_stats = {}
+_lock = threading.Lock()
+# (class, attribute) -> original function
+_patched = {}
+
+
+def _new_entry():
+    return {"calls": 0, "bytes": 0, "cache_hits": 0, "time": 0.0,
+            "latency_histogram": [0] * HISTOGRAM_BINS}
+
+
+def record(stage, elapsed, nbytes=0, cache_hit=False):
+    """Record a single call of the stage
+
+    # Arguments
+      stage: name of the stage
+      elapsed: duration of the call in seconds
+      nbytes: number of bytes returned
+      cache_hit: whether the call was served from a cache
+    """
+    bucket = min(int(elapsed * 1e6).bit_length(), HISTOGRAM_BINS - 1)
+    with _lock:
+        entry = _stats.get(stage)
+        if entry is None:
+            entry = _stats[stage] = _new_entry()
+        entry["calls"] += 1
+        entry["bytes"] += nbytes
+        entry["cache_hits"] += int(cache_hit)
+        entry["time"] += elapsed
+        entry["latency_histogram"][bucket] += 1
+
+
+def _nbytes(obj):
+    """Approximate number of bytes of the returned object
+    """
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (str, bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(v) for v in obj)
+    return 0
+
+
+def _instrument_generator(gen, stage, elapsed):
+    # the time spent producing the items is attributed to the stage
+    nbytes = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(gen)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            nbytes += _nbytes(item)
+            yield item
+    finally:
+        record(stage, elapsed, nbytes)
+
+
+def _instrument(fn, stage, cache=False):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if inspect.isgenerator(result):
+            return _instrument_generator(result, stage, elapsed)
+        record(stage, elapsed, _nbytes(result), cache_hit=cache and result is not None)
+        return result
+    return wrapper
+
+
+def _subclasses(cls):
+    yield cls
+    for subclass in cls.__subclasses__():
+        yield from _subclasses(subclass)
+
+
+def _instrumentation_points():
+    """List of (class, attribute, is_cache)
+    """
+    from kipoiseq.extractors import BaseExtractor, FastaStringExtractor, MultiSampleVCF
+    from kipoiseq.dataloaders import BedDataset, StringSeqIntervalDl, SeqIntervalDl, MMSpliceDl
+    from kipoiseq.transforms import OneHot, ReorderedOneHot
+    from kipoiseq.transforms.transforms import LRUCache
+
+    points = [(cls, attr, False)
+              for cls in set(_subclasses(BaseExtractor))
+              for attr in ["extract", "extract_batch"]
+              if attr in cls.__dict__]
+    points += [(FastaStringExtractor, "_read_bytes", False),
+               (MultiSampleVCF, "fetch_variants", False),
+               (BedDataset, "__getitem__", False),
+               (StringSeqIntervalDl, "__getitem__", False),
+               (SeqIntervalDl, "__getitem__", False),
+               (MMSpliceDl, "__next__", False),
+               (OneHot, "__call__", False),
+               (OneHot, "batch", False),
+               (ReorderedOneHot, "__call__", False),
+               (ReorderedOneHot, "batch", False),
+               (LRUCache, "get", True)]
+    return points
+
+
+def enable():
+    """Start recording the stats
+
+    Only the classes defined at the time of calling are instrumented.
+    """
+    with _lock:
+        for cls, attr, cache in _instrumentation_points():
+            if (cls, attr) in _patched:
+                continue
+            fn = cls.__dict__[attr]
+            _patched[(cls, attr)] = fn
+            setattr(cls, attr, _instrument(fn, "{}.{}".format(cls.__name__, attr), cache))
+
+
+def disable():
+    """Stop recording the stats and restore the original methods. The recorded stats are kept.
+    """
+    with _lock:
+        for (cls, attr), fn in _patched.items():
+            setattr(cls, attr, fn)
+        _patched.clear()
+
+
+def is_enabled():
+    return len(_patched) > 0
+
+
+def get_stats():
+    """Get the recorded stats
+
+    # Returns
+      dict: stage name -> dict with the keys `calls`, `bytes`, `cache_hits`,
+        `time` (total, in seconds) and `latency_histogram`
+    """
+    with _lock:
+        return deepcopy(_stats)
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def merge_stats(*stats):
+    """Merge the stats (e.g. of different worker processes) returned by `get_stats`
+    """
+    merged = {}
+    for s in stats:
+        for stage, entry in s.items():
+            m = merged.setdefault(stage, _new_entry())
+            for key in ["calls", "bytes", "cache_hits", "time"]:
+                m[key] += entry[key]
+            m["latency_histogram"] = [a + b for a, b in zip(m["latency_histogram"],
+                                                            entry["latency_histogram"])]
+    return merged
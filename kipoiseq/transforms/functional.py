@@ -4,6 +4,8 @@ from __future__ import print_function
 
 from kipoiseq.utils import DNA
 from copy import deepcopy
+from functools import lru_cache
+from itertools import product
 import numpy as np
 from six import string_types
 
@@ -21,21 +23,115 @@ def _get_alphabet_dict(alphabet):
     return {l: i for i, l in enumerate(alphabet)}
 
 
-def _get_index_dict(alphabet):
-    return {i: l for i, l in enumerate(alphabet)}
+def one_hot2token(arr, neutral_value=None):
+    """Convert a one-hot encoded array of shape `(..., L, alphabet_size)` to tokens
+
+    # Arguments
+       arr: one-hot encoded array
+       neutral_value: if not None, rows with all the values equal
+         to `neutral_value` are assigned to -1. All-zero rows are assigned
+         to -1 as well, since integer and boolean arrays encode the neutral
+         elements with zeros (see `get_neutral_value`).
+
+    # Returns
+       Integer array of shape `(..., L)`
+    """
+    arr = np.asarray(arr)
+    tokens = arr.argmax(axis=-1)
+    if neutral_value is not None:
+        neutral = np.all(arr == neutral_value, axis=-1)
+        if neutral_value != 0:
+            neutral |= ~np.any(arr, axis=-1)
+        tokens[neutral] = -1
+    return tokens
+
+
+@lru_cache(maxsize=None)
+def _get_letter_table(alphabet, neutral_letter):
+    """Build a (len(alphabet) + 1, nchar) uint8 table of the letters.
+    The neutral letter is the last row (token -1).
+    """
+    table = np.frombuffer("".join(alphabet + (neutral_letter,)).encode("ascii"), dtype=np.uint8)
+    table = table.reshape((len(alphabet) + 1, len(neutral_letter)))
+    return table
 
 
-def one_hot2token(arr):
-    return arr.argmax(axis=2)
+def token2string(tokens, alphabet=DNA, neutral_alphabet="N"):
+    """Convert tokens back to string(s)
 
+    # Arguments
+       tokens: integer array of shape `(..., L)` as returned by `tokenize`
+       alphabet: Alphabet to use
+       neutral_alphabet: letter used for the neutral tokens (-1)
 
-def one_hot2string(arr, alphabet=DNA):
+    # Returns
+       String for a 1-dimensional `tokens` array, otherwise a (nested) list of strings
+    """
+    if not isinstance(neutral_alphabet, str):
+        neutral_alphabet = neutral_alphabet[0]
+    tokens = np.asarray(tokens)
+    chars = _get_letter_table(tuple(alphabet), neutral_alphabet)[tokens]
+    chars = chars.reshape(tokens.shape[:-1] + (-1,))
+
+    if chars.ndim == 1:
+        return chars.tobytes().decode("ascii")
+    if chars.shape[-1] == 0:
+        return np.full(chars.shape[:-1], "", dtype=object).tolist()
+    # view each row as a single fixed-width byte string
+    strings = np.ascontiguousarray(chars).view("S{}".format(chars.shape[-1]))[..., 0]
+    return np.char.decode(strings, "ascii").tolist()
+
+
+def one_hot2string(arr, alphabet=DNA, neutral_alphabet="N", neutral_value=.25):
     """Convert a one-hot encoded array back to string
+
+    # Arguments
+       arr: one-hot encoded array of shape `(..., L, len(alphabet))`
+       alphabet: Alphabet to use
+       neutral_alphabet: letter used for the rows with all values equal to `neutral_value`
+         and for the all-zero rows
+       neutral_value: value of the neutral element
+
+    # Returns
+       String for a 2-dimensional array, otherwise a (nested) list of strings
+    """
+    return token2string(one_hot2token(arr, neutral_value), alphabet, neutral_alphabet)
+
+
+# value of the characters present neither in the alphabet nor in the neutral alphabet
+_UNKNOWN_TOKEN = -2
+
+
+@lru_cache(maxsize=None)
+def _get_token_table(alphabet, neutral_alphabet):
+    """Build a 256-entry lookup table mapping an ascii code to its token
+
+    # Arguments
+       alphabet: tuple of single-character letters
+       neutral_alphabet: tuple of single-character letters mapped to -1
+    """
+    table = np.full(256, _UNKNOWN_TOKEN, dtype=int)
+    for i, l in enumerate(alphabet):
+        table[ord(l.encode("ascii"))] = i
+    for l in neutral_alphabet:
+        table[ord(l.encode("ascii"))] = -1
+    table.setflags(write=False)
+    return table
+
+
+def _tokenize_codes(codes, alphabet, neutral_alphabet):
+    """Tokenize an array of ascii codes (uint8) for single-character alphabets
     """
-    tokens = one_hot2token(arr)
-    indexToLetter = _get_index_dict(alphabet)
+    tokens = _get_token_table(tuple(alphabet), tuple(neutral_alphabet))[codes]
+    if tokens.size and tokens.min() == _UNKNOWN_TOKEN:
+        raise KeyError(chr(codes[tokens == _UNKNOWN_TOKEN][0]))
+    return tokens
+
 
-    return [''.join([indexToLetter[x] for x in row]) for row in tokens]
+def _tokenize_table(seq, alphabet, neutral_alphabet):
+    """Vectorized `tokenize` for single-character alphabets
+    """
+    return _tokenize_codes(np.frombuffer(seq.encode("ascii"), dtype=np.uint8), alphabet, neutral_alphabet)
 
 
 def tokenize(seq, alphabet=DNA, neutral_alphabet=["N"]):
@@ -58,59 +154,405 @@ def tokenize(seq, alphabet=DNA, neutral_alphabet=["N"]):
         assert len(l) == nchar
     assert len(seq) % nchar == 0  # since we are using striding
 
+    if nchar == 1:
+        try:
+            return _tokenize_table(seq, alphabet, neutral_alphabet)
+        except UnicodeEncodeError:
+            # non-ascii characters can't be looked up in the byte table
+            pass
+
     alphabet_dict = _get_alphabet_dict(alphabet)
     for l in neutral_alphabet:
         alphabet_dict[l] = -1
-    # current performance bottleneck
     return np.array([alphabet_dict[seq[(i * nchar):((i + 1) * nchar)]] for i in range(len(seq) // nchar)])
 
 
+def kmer_alphabet(k, alphabet=DNA):
+    """All the k-mers of the alphabet in the token order used by `tokenize_kmers`
+
+    # Arguments
+       k: k-mer length
+       alphabet: single-character alphabet
+
+    # Returns
+       List of `len(alphabet) ** k` strings. Can be used as the alphabet for `tokenize`.
+    """
+    return ["".join(kmer) for kmer in product(alphabet, repeat=k)]
+
+
+def tokenize_kmers(seq, k, stride=1, alphabet=DNA, neutral_alphabet=["N"]):
+    """Convert sequence to k-mer integers
+
+    The k-mer index is computed arithmetically from the single-letter tokens
+    and matches the order of `kmer_alphabet(k, alphabet)`.
+
+    # Arguments
+       seq: Sequence to encode (string or `PackedSeq`)
+       k: k-mer length
+       stride: step between two consecutive k-mers. Use `stride=1` for
+         overlapping k-mers and `stride=k` for non-overlapping k-mers (e.g. codons).
+       alphabet: single-character alphabet to use
+       neutral_alphabet: Neutral alphabet -> k-mers containing any of these are assigned to -1
+
+    # Returns
+       Array of length `(len(seq) - k) // stride + 1` with integers
+       from `-1` to `len(alphabet) ** k - 1`
+    """
+    if len(alphabet[0]) != 1:
+        raise ValueError("tokenize_kmers requires a single-character alphabet")
+    if isinstance(seq, PackedSeq):
+        base_tokens = packed2token(seq, alphabet)
+    else:
+        base_tokens = tokenize(seq, alphabet, neutral_alphabet)
+
+    n = max(0, (len(base_tokens) - k) // stride + 1)
+    tokens = np.zeros(n, dtype=int)
+    neutral = np.zeros(n, dtype=bool)
+    alphabet_size = len(alphabet)
+    for i in range(k):
+        # i-th letter of every k-mer
+        letter_tokens = base_tokens[i:i + (n - 1) * stride + 1:stride]
+        tokens *= alphabet_size
+        tokens += letter_tokens
+        neutral |= letter_tokens < 0
+    tokens[neutral] = -1
+    return tokens
+
+
+def _tokenize_batch(seqs, alphabet=DNA, neutral_alphabet=["N"]):
+    """Tokenize a list of equal-length sequences into a (N, L) array
+    """
+    if isinstance(neutral_alphabet, str):
+        neutral_alphabet = [neutral_alphabet]
+    nchar = len(alphabet[0])
+    if isinstance(seqs, np.ndarray):
+        # (N, L) matrix of ascii codes as returned by `fixed_len_batch`
+        if nchar != 1:
+            raise ValueError("Only single-character alphabets are supported for uint8 matrices")
+        return _tokenize_codes(seqs, alphabet, neutral_alphabet)
+    seqlen = len(seqs[0])
+    for seq in seqs:
+        if len(seq) != seqlen:
+            raise ValueError("All the sequences need to have the same length")
+    if isinstance(seqs[0], PackedSeq):
+        return np.stack([packed2token(seq, alphabet) for seq in seqs])
+    if seqlen % nchar != 0:
+        raise ValueError("Sequence length needs to be a multiple of the alphabet element length")
+    return tokenize("".join(seqs), alphabet, neutral_alphabet).reshape((len(seqs), seqlen // nchar))
+
+
+def _one_hot_into(tokens, out, neutral_value=.25):
+    """Write the one-hot encoding of `tokens` into `out`
+
+    `out` has the shape `tokens.shape + (alphabet_size,)` and can be an arbitrary
+    (also non-contiguous) view. No temporary arrays of the output size are created.
+    """
+    neutral_value = get_neutral_value(neutral_value, out.dtype)
+    for i in range(out.shape[-1]):
+        np.equal(tokens, i, out=out[..., i], casting='unsafe')
+    if neutral_value != 0:
+        out[tokens < 0] = neutral_value
+    return out
+
+
+def get_neutral_value(neutral_value, dtype):
+    """Neutral value as written into an array of the given dtype
+
+    Integer and boolean dtypes can't represent fractional values (e.g. 0.25).
+    Instead of truncating (or setting True for bool), the neutral elements
+    are encoded with all zeros for these dtypes.
+
+    # Arguments
+       neutral_value: value of the neutral element
+       dtype: numpy dtype of the one-hot encoded array
+    """
+    dtype = np.dtype(dtype)
+    if (np.issubdtype(dtype, np.integer) or dtype == np.bool_) and neutral_value != int(neutral_value):
+        return 0
+    return neutral_value
+
+
 def token2one_hot(tokens, alphabet_size=4, neutral_value=.25, dtype=None):
     """
     Note: everything out of the alphabet is transformed into `np.zeros(alphabet_size)`
     """
-    arr = np.zeros((len(tokens), alphabet_size), dtype=dtype)
-
-    tokens_range = np.arange(len(tokens), dtype=int)
-    arr[tokens_range[tokens >= 0], tokens[tokens >= 0]] = 1
-    if neutral_value != 0:
-        arr[tokens_range[tokens < 0], :] = neutral_value
-    return arr
+    arr = np.empty((len(tokens), alphabet_size), dtype=dtype)
+    return _one_hot_into(tokens, arr, neutral_value)
 
 
 def one_hot(seq, alphabet=DNA, neutral_alphabet=['N'], neutral_value=.25, dtype=None):
+    if isinstance(seq, PackedSeq):
+        return packed2one_hot(seq, alphabet, neutral_value, dtype=dtype)
     if not isinstance(seq, str):
         raise ValueError("seq needs to be a string")
     return token2one_hot(tokenize(seq, alphabet, neutral_alphabet), len(alphabet), neutral_value, dtype=dtype)
 
 
+def one_hot_batch(seqs, out=None, alphabet=DNA, neutral_alphabet=['N'], neutral_value=.25, dtype=None):
+    """One-hot encode a list of equal-length sequences in a single pass
+
+    # Arguments
+       seqs: list of sequences (strings or `PackedSeq`) of the same length or
+         a (N, L) uint8 matrix of ascii codes (see `fixed_len_batch`)
+       out: (optional) pre-allocated array of shape `(len(seqs), seqlen, len(alphabet))`
+         into which the one-hot encoding is written. If None, a new array is allocated.
+       alphabet: Alphabet to use
+       neutral_alphabet: Neutral alphabet -> encoded with `neutral_value`
+       neutral_value: value of the neutral element
+       dtype: numpy dtype of the newly allocated array. Ignored if `out` is specified.
+
+    # Returns
+       Array of shape `(len(seqs), seqlen, len(alphabet))`. `out` if specified.
+    """
+    if isinstance(seqs, str):
+        raise ValueError("seqs needs to be a list of strings")
+    if len(seqs) == 0:
+        tokens = np.zeros((0, 0), dtype=int)
+    else:
+        tokens = _tokenize_batch(seqs, alphabet, neutral_alphabet)
+
+    shape = tokens.shape + (len(alphabet),)
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape:
+        raise ValueError("out has the wrong shape: {}. Expected: {}".format(out.shape, shape))
+    return _one_hot_into(tokens, out, neutral_value)
+
+
 def one_hot_dna(seq, dtype=None):
     """One-hot encode DNA sequence
+
+    The array is directly allocated with the requested dtype (e.g. np.float16, np.int8,
+    np.uint8 or bool). See `get_neutral_value` for the encoding of N in integer dtypes.
     """
     if not isinstance(seq, str):
         raise ValueError("seq needs to be a string")
 
-    if one_hot_encode_sequence is not None:
-        # genomelake's one_hot_encode_sequence could be imported
+    if one_hot_encode_sequence is not None and np.dtype(dtype) == np.float32:
+        # genomelake's one_hot_encode_sequence could be imported.
+        # It only writes float32 arrays
         out = np.zeros((len(seq), 4), dtype=np.float32)
         one_hot_encode_sequence(seq, out)
-        return out.astype(dtype)
+        return out
     else:
         return one_hot(seq, alphabet=DNA, neutral_alphabet=['N'], neutral_value=.25, dtype=dtype)
 
+# reverse-complement
+
+_COMPLEMENT = {"A": "T", "C": "G", "G": "C", "T": "A", "U": "A"}
+
+
+def _get_complement_perm(alphabet):
+    """Index of the complementary letter for each letter in the alphabet
+    """
+    alphabet_dict = _get_alphabet_dict(alphabet)
+    complement = dict(_COMPLEMENT)
+    if "U" in alphabet_dict:
+        # RNA
+        complement["A"] = "U"
+    try:
+        return np.array([alphabet_dict[complement[l]] for l in alphabet], dtype=int)
+    except KeyError:
+        raise ValueError("Alphabet {} is not closed under complementation".format(alphabet))
+
+
+def rc_one_hot(arr, alphabet=DNA, seq_axis=-2, alphabet_axis=-1):
+    """Reverse-complement one-hot encoded sequence(s)
+
+    Returns a view of `arr` if the complement of the alphabet equals the
+    reversed alphabet (e.g. `ACGT`), otherwise a copy.
+
+    # Arguments
+       arr: one-hot encoded array. Can contain additional (batch) axes.
+       alphabet: alphabet used for the one-hot encoding
+       seq_axis: axis along which the sequence runs
+       alphabet_axis: axis along which the alphabet runs
+
+    # Returns
+       Reverse-complemented array of the same shape as `arr`
+    """
+    perm = _get_complement_perm(alphabet)
+    arr = np.flip(arr, axis=seq_axis)
+    if np.array_equal(perm, np.arange(len(perm))[::-1]):
+        return np.flip(arr, axis=alphabet_axis)
+    else:
+        return np.take(arr, perm, axis=alphabet_axis)
+
+
+def rc_tokens(tokens, alphabet=DNA, seq_axis=-1):
+    """Reverse-complement tokenized sequence(s)
+
+    # Arguments
+       tokens: integer array as returned by `tokenize`. Can contain additional (batch) axes.
+       alphabet: alphabet used for tokenization
+       seq_axis: axis along which the sequence runs
+
+    # Returns
+       Reverse-complemented array of the same shape as `tokens`. Neutral tokens (-1) are kept.
+    """
+    # the last element maps the neutral token (-1) onto itself
+    perm = np.append(_get_complement_perm(alphabet), -1)
+    return perm[np.flip(tokens, axis=seq_axis)]
+
+
+# 2-bit packed sequences
+
+# code of the bases that can't be represented with 2 bits
+_PACKED_MASKED = 4
+
+
+def _get_pack_table():
+    table = np.full(256, _PACKED_MASKED, dtype=np.uint8)
+    for i, l in enumerate(DNA):
+        table[ord(l)] = i
+        table[ord(l.lower())] = i
+    table.setflags(write=False)
+    return table
+
+
+_PACK_TABLE = _get_pack_table()
+
+
+class PackedSeq(object):
+    """DNA sequence stored with 2 bits per base
+
+    Bases other than A, C, G and T (e.g. N) are tracked in a separate
+    bit mask and are decoded as N. Lower-case bases are stored as upper-case.
+    Use `string2packed` to create the object.
+
+    # Arguments
+      data: uint8 array holding 4 bases per byte
+      mask: uint8 array (see `np.packbits`) marking the non-ACGT bases
+      length: sequence length
+    """
+
+    def __init__(self, data, mask, length):
+        self.data = data
+        self.mask = mask
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return "PackedSeq(length={})".format(self.length)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.mask.nbytes
+
+    def to_string(self):
+        return packed2string(self)
+
+    def to_tokens(self, alphabet=DNA):
+        return packed2token(self, alphabet)
+
+    def to_one_hot(self, alphabet=DNA, neutral_value=.25, dtype=None):
+        return packed2one_hot(self, alphabet, neutral_value, dtype)
+
+
+def string2packed(seq):
+    """Pack the DNA sequence into 2 bits per base
+
+    # Arguments
+       seq: DNA sequence (string)
+
+    # Returns
+       `PackedSeq`
+    """
+    if not isinstance(seq, str):
+        raise ValueError("seq needs to be a string")
+    return _chars2packed(np.frombuffer(seq.encode("ascii"), dtype=np.uint8))
+
+
+def _chars2packed(arr):
+    """Pack an array of ascii codes (uint8)
+    """
+    codes = _PACK_TABLE[arr]
+    return _pack_codes(codes, codes == _PACKED_MASKED)
+
+
+def _pack_codes(codes, mask):
+    """Pack the codes 0-3 (A, C, G, T) and the boolean mask of non-ACGT bases
+    """
+    # 4 bases per byte, first base in the most significant bits
+    codes4 = np.zeros(-(-len(codes) // 4) * 4, dtype=np.uint8)
+    codes4[:len(codes)] = codes
+    codes4[:len(codes)][mask] = 0
+    codes4 = codes4.reshape((-1, 4))
+    data = (codes4[:, 0] << 6) | (codes4[:, 1] << 4) | (codes4[:, 2] << 2) | codes4[:, 3]
+    return PackedSeq(data, np.packbits(mask), len(codes))
+
+
+def _unpack_range(data, mask, start, end):
+    """Unpack the bases `start:end` to codes 0-3 (A, C, G, T) and the boolean mask of non-ACGT bases
+
+    # Arguments
+       data: uint8 array holding 4 bases per byte
+       mask: uint8 array (see `np.packbits`) marking the non-ACGT bases
+    """
+    data = data[start // 4:-(-end // 4)]
+    codes = (data[:, np.newaxis] >> np.array([6, 4, 2, 0], dtype=np.uint8)) & 3
+    codes = codes.reshape((-1,))[start % 4:start % 4 + end - start]
+    mask = np.unpackbits(mask[start // 8:-(-end // 8)])[start % 8:start % 8 + end - start].astype(bool)
+    return codes, mask
+
+
+def _packed2codes(packed):
+    """Unpack to codes 0-3 (A, C, G, T) and the boolean mask of non-ACGT bases
+    """
+    return _unpack_range(packed.data, packed.mask, 0, packed.length)
+
+
+def _codes2chars(codes, mask):
+    """Convert the unpacked codes to ascii codes (uint8)
+    """
+    return np.frombuffer(b"ACGTN", dtype=np.uint8)[np.where(mask, _PACKED_MASKED, codes)]
+
+
+def packed2token(packed, alphabet=DNA):
+    """Convert `PackedSeq` to integers
+
+    # Arguments
+       packed: `PackedSeq`
+       alphabet: permutation of the DNA alphabet defining the token order
+
+    # Returns
+       Array of length `len(packed)` with integers from `-1` (non-ACGT bases) to `3`
+    """
+    codes, mask = _packed2codes(packed)
+    alphabet_dict = _get_alphabet_dict(alphabet)
+    code2token = np.array([alphabet_dict[l] for l in DNA], dtype=int)
+    tokens = code2token[codes]
+    tokens[mask] = -1
+    return tokens
+
+
+def packed2string(packed):
+    """Convert `PackedSeq` back to a string. Non-ACGT bases are returned as N.
+    """
+    return _codes2chars(*_packed2codes(packed)).tobytes().decode("ascii")
+
+
+def packed2one_hot(packed, alphabet=DNA, neutral_value=.25, dtype=None):
+    """One-hot encode `PackedSeq`
+    """
+    return token2one_hot(packed2token(packed, alphabet), len(alphabet), neutral_value, dtype=dtype)
+
+
 # sequence trimming
 
 
 def pad(seq, length, value="N", anchor="center"):
     seq_len = len(seq)
     assert length >= seq_len
-    if anchor is "end":
+    if anchor == "end":
         n_left = length - seq_len
         n_right = 0
-    elif anchor is "start":
+    elif anchor == "start":
         n_right = length - seq_len
         n_left = 0
-    elif anchor is "center":
+    elif anchor == "center":
         n_left = (length - seq_len) // 2 + (length - seq_len) % 2
         n_right = (length - seq_len) // 2
     else:
@@ -127,11 +569,11 @@ def trim(seq, length, anchor="center"):
     seq_len = len(seq)
 
     assert length <= seq_len
-    if anchor is "end":
+    if anchor == "end":
         return seq[-length:]
-    elif anchor is "start":
+    elif anchor == "start":
         return seq[0:length]
-    elif anchor is "center":
+    elif anchor == "center":
         dl = seq_len - length
         n_left = dl // 2 + dl % 2
         n_right = seq_len - dl // 2
@@ -196,6 +638,67 @@ def fixed_len(seq, length, anchor="center", value="N"):
         return seq
 
 
+def fixed_len_batch(seqs, length, anchor="center", value="N"):
+    """Pad and/or trim a list of sequences into a fixed-width matrix of ascii codes
+
+    Uses the same anchoring as `fixed_len`. The result can be directly one-hot
+    encoded with `one_hot_batch` or `ReorderedOneHot.batch`.
+
+    # Arguments
+        seqs: list of sequences (strings) of various lengths
+        length: final length of the sequences
+        anchor: character; 'start', 'end' or 'center'
+        value: single character used for padding
+
+    # Returns
+        uint8 array of shape `(len(seqs), length)`.
+        Use `.view('S{length}')` or `.tobytes()` to get back the characters.
+    """
+    if len(value) != 1:
+        raise ValueError("value needs to be a single character")
+    if anchor not in ["start", "end", "center"]:
+        raise ValueError("anchor can be of: end, start or center")
+
+    out = np.full((len(seqs), length), ord(value), dtype=np.uint8)
+    if len(seqs) == 0:
+        return out
+    buf = np.frombuffer("".join(seqs).encode("ascii"), dtype=np.uint8)
+    lens = np.array([len(seq) for seq in seqs], dtype=int)
+    seq_starts = np.cumsum(lens) - lens
+
+    diff = np.abs(length - lens)
+    if anchor == "start":
+        offsets = np.zeros_like(diff)
+    elif anchor == "end":
+        offsets = diff
+    else:
+        offsets = diff // 2 + diff % 2
+    # padded sequences are shifted in the output, trimmed ones in the input
+    out_offsets = np.where(lens < length, offsets, 0)
+    seq_starts += np.where(lens > length, offsets, 0)
+    ncopy = np.minimum(lens, length)
+
+    for i, (out_offset, seq_start, n) in enumerate(zip(out_offsets, seq_starts, ncopy)):
+        out[i, out_offset:out_offset + n] = buf[seq_start:seq_start + n]
+    return out
+
+
+def pad_batch(seqs, length, value="N", anchor="center"):
+    """Batch version of `pad`. See `fixed_len_batch`.
+    """
+    if any(len(seq) > length for seq in seqs):
+        raise ValueError("All the sequences need to be shorter or equal to length")
+    return fixed_len_batch(seqs, length, anchor=anchor, value=value)
+
+
+def trim_batch(seqs, length, anchor="center"):
+    """Batch version of `trim`. See `fixed_len_batch`.
+    """
+    if any(len(seq) < length for seq in seqs):
+        raise ValueError("All the sequences need to be longer or equal to length")
+    return fixed_len_batch(seqs, length, anchor=anchor)
+
+
 def resize_interval(interval, width, anchor='center'):
     """Resize the Interval. Returns new Interval instance with correct length.
 
@@ -219,3 +722,33 @@ def resize_interval(interval, width, anchor='center'):
         raise Exception("Interval resizing anchor point can only be 'start', 'end' or 'center'")
 
     return interval
+
+
+def resize_intervals(starts, ends, width, anchor='center'):
+    """Vectorized `resize_interval` for many intervals at once
+
+    Arguments:
+        starts: array of interval start positions
+        ends: array of interval end positions
+        width: desired width of the output intervals
+        anchor (str): which part of the sequence should be anchored. Choices: 'start', 'center', or 'end'
+
+    Returns:
+        tuple of new (starts, ends) arrays
+    """
+    starts = np.asarray(starts, dtype=int)
+    ends = np.asarray(ends, dtype=int)
+
+    if anchor == "start":
+        ends = starts + width
+    elif anchor == "end":
+        starts = ends - width
+    elif anchor == "center":
+        center = (starts + ends) // 2
+        half_len = width // 2
+        starts = center - half_len
+        ends = center + half_len + width % 2
+    else:
+        raise Exception("Interval resizing anchor point can only be 'start', 'end' or 'center'")
+
+    return starts, ends
@@ -2,6 +2,14 @@ from __future__ import division
 from __future__ import absolute_import
 from __future__ import print_function
 
+import hashlib
+import os
+import pickle
+import threading
+import time
+import warnings
+from collections import OrderedDict
+
 import numpy as np
 from kipoiseq.transforms import functional as F
 from kipoiseq.utils import DNA, parse_alphabet, parse_dtype
@@ -13,6 +21,11 @@ class Compose(object):
     # Arguments
 
         transforms (list of ``Transform`` objects): list of transforms to compose.
+        compile (bool): if True, fuse `OneHot` with the directly following
+          `DummyAxis`, `SwapAxes`, `Cast` and `ReverseComplement` transforms into a single
+          kernel writing the final array in one pass. The output is the same as without compiling.
+        profile (bool): if True, record the number of calls and the time spent in each stage.
+          See `get_stats()`.
 
     Example:
         >>> transforms.Compose([
@@ -21,14 +34,55 @@ class Compose(object):
         >>> ])
     """
 
-    def __init__(self, transforms):
+    def __init__(self, transforms, compile=False, profile=False):
         self.transforms = transforms
+        self.compile = compile
+        self.profile = profile
+        if compile:
+            self.stages = _fuse_transforms(transforms)
+        else:
+            self.stages = list(transforms)
+        self.reset_stats()
 
     def __call__(self, img):
-        for t in self.transforms:
+        if self.profile:
+            return self._run_profiled(img, _call)
+        for t in self.stages:
             img = t(img)
         return img
 
+    def batch(self, imgs):
+        """Apply the transforms to a batch of inputs
+
+        Transforms implementing the `batch` method process the whole batch at once,
+        others are applied to each element separately.
+        """
+        if self.profile:
+            return self._run_profiled(imgs, _call_batch)
+        for t in self.stages:
+            imgs = _call_batch(t, imgs)
+        return imgs
+
+    def _run_profiled(self, img, call_fn):
+        for i, t in enumerate(self.stages):
+            start = time.perf_counter()
+            img = call_fn(t, img)
+            self.stats[i]['calls'] += 1
+            self.stats[i]['time'] += time.perf_counter() - start
+        return img
+
+    def reset_stats(self):
+        self.stats = [{'calls': 0, 'time': 0.0} for t in self.stages]
+
+    def get_stats(self):
+        """Get the number of calls and the total time (in seconds) spent in each stage
+
+        # Returns
+            OrderedDict with `'<index>_<class name>'` of the stage as key
+        """
+        return OrderedDict([("{}_{}".format(i, t.__class__.__name__), dict(stats))
+                            for i, (t, stats) in enumerate(zip(self.stages, self.stats))])
+
     def __repr__(self):
         format_string = self.__class__.__name__ + '('
         for t in self.transforms:
@@ -38,6 +92,26 @@ class Compose(object):
         return format_string
 
 
+def _call(t, x):
+    return t(x)
+
+
+def _call_batch(t, xs):
+    if hasattr(t, 'batch'):
+        return t.batch(xs)
+    else:
+        return [t(x) for x in xs]
+
+
+def _batch_axis(axis):
+    """Shift the axis to account for the additional batch axis
+    """
+    if axis is not None and axis >= 0:
+        return axis + 1
+    else:
+        return axis
+
+
 # numpy wrappers
 
 class DummyAxis(object):
@@ -53,6 +127,9 @@ class DummyAxis(object):
         else:
             return x
 
+    def batch(self, x):
+        return DummyAxis(_batch_axis(self.axis))(x)
+
 
 class SwapAxes(object):
     """np.swapaxes wrapper
@@ -70,6 +147,23 @@ class SwapAxes(object):
         else:
             return np.swapaxes(x, self.axis1, self.axis2)
 
+    def batch(self, x):
+        return SwapAxes(_batch_axis(self.axis1), _batch_axis(self.axis2))(x)
+
+
+class Cast(object):
+    """np.ndarray.astype wrapper
+    """
+
+    def __init__(self, dtype):
+        self.dtype = parse_dtype(dtype)
+
+    def __call__(self, x):
+        return np.asarray(x).astype(self.dtype)
+
+    def batch(self, x):
+        return self(x)
+
 # Intervals
 
 
@@ -109,7 +203,8 @@ class OneHot(object):
         self.dtype = dtype
 
     def __call__(self, seq):
-        if self.alphabet == DNA and self.neutral_alphabet == ['N'] and self.neutral_value == 0.25:
+        if self.alphabet == DNA and self.neutral_alphabet == ['N'] and self.neutral_value == 0.25 \
+                and not isinstance(seq, F.PackedSeq):
             return F.one_hot_dna(seq, self.dtype)
         else:
             return F.one_hot(seq,
@@ -118,6 +213,37 @@ class OneHot(object):
                              neutral_value=self.neutral_value,
                              dtype=self.dtype)
 
+    def batch(self, seqs, out=None):
+        """One-hot encode a list of equal-length sequences
+
+        # Arguments
+          seqs: list of sequences of the same length
+          out: (optional) pre-allocated array of shape `(len(seqs), seqlen, len(alphabet))`
+            which can be re-used across batches
+
+        # Returns
+          Array of shape `(len(seqs), seqlen, len(alphabet))`
+        """
+        return F.one_hot_batch(seqs, out,
+                               alphabet=self.alphabet,
+                               neutral_alphabet=self.neutral_alphabet,
+                               neutral_value=self.neutral_value,
+                               dtype=self.dtype)
+
+
+def _seq_alphabet_view(out, output_axes):
+    """View of the output array with the (..., seq, alphabet) axes order
+
+    # Arguments
+      out: array with the trailing axes named by `output_axes`
+      output_axes: tuple containing 'seq', 'alphabet' and (optionally) 'dummy'
+    """
+    index = tuple(0 if axis == 'dummy' else slice(None) for axis in output_axes)
+    out = out[(Ellipsis,) + index]
+    if output_axes.index('alphabet') < output_axes.index('seq'):
+        out = np.swapaxes(out, -1, -2)
+    return out
+
 
 class ReorderedOneHot(object):
     """Flexible one-hot encoding class that can account for
@@ -172,18 +298,52 @@ class ReorderedOneHot(object):
         if existing_alphabet_axis == self.alphabet_axis:
             self.alphabet_axis = None
 
-        # how to transform the input
-        self.transform = Compose([
-            OneHot(self.alphabet,
-                   neutral_alphabet=self.neutral_alphabet,
-                   neutral_value=self.neutral_value,
-                   dtype=self.dtype),  # one-hot-encode
-            DummyAxis(self.dummy_axis),  # optionally inject the dummy axis
-            SwapAxes(existing_alphabet_axis, self.alphabet_axis),  # put the alphabet axis elsewhere
-        ])
+        # name of each output axis
+        output_axes = ['seq', 'alphabet']
+        if self.dummy_axis is not None:
+            output_axes.insert(self.dummy_axis, 'dummy')
+        if self.alphabet_axis is not None:
+            output_axes[existing_alphabet_axis], output_axes[self.alphabet_axis] = \
+                output_axes[self.alphabet_axis], output_axes[existing_alphabet_axis]
+        self.output_axes = tuple(output_axes)
 
     def __call__(self, seq):
-        return self.transform(seq)
+        if isinstance(seq, F.PackedSeq):
+            return self._encode(F.packed2token(seq, self.alphabet))
+        if not isinstance(seq, str):
+            raise ValueError("seq needs to be a string")
+        tokens = F.tokenize(seq, self.alphabet, self.neutral_alphabet)
+        return self._encode(tokens)
+
+    def batch(self, seqs, out=None):
+        """One-hot encode a list of equal-length sequences
+
+        # Arguments
+          seqs: list of sequences of the same length
+          out: (optional) pre-allocated array of shape `(len(seqs),) + self.get_output_shape(seqlen)`
+            which can be re-used across batches
+
+        # Returns
+          Array of shape `(len(seqs),) + self.get_output_shape(seqlen)`
+        """
+        if isinstance(seqs, str):
+            raise ValueError("seqs needs to be a list of strings")
+        if len(seqs) == 0:
+            tokens = np.zeros((0, 0), dtype=int)
+        else:
+            tokens = F._tokenize_batch(seqs, self.alphabet, self.neutral_alphabet)
+        return self._encode(tokens, out)
+
+    def _encode(self, tokens, out=None):
+        """One-hot encode the tokens directly into the (C-contiguous) output layout
+        """
+        shape = tokens.shape[:-1] + self.get_output_shape(tokens.shape[-1])
+        if out is None:
+            out = np.empty(shape, dtype=self.dtype)
+        elif out.shape != shape:
+            raise ValueError("out has the wrong shape: {}. Expected: {}".format(out.shape, shape))
+        F._one_hot_into(tokens, _seq_alphabet_view(out, self.output_axes), self.neutral_value)
+        return out
 
     def get_output_shape(self, seqlen=None):
         """Compute the output shape
@@ -217,6 +377,270 @@ class ReorderedOneHot(object):
         return output_shape
 
 
+class ReverseComplement(object):
+    """Reverse-complement one-hot encoded or tokenized sequence(s)
+
+    One-hot encoded arrays are returned as views for the alphabets
+    where the complement equals the reversed alphabet (e.g. 'ACGT').
+
+    # Arguments
+      alphabet: alphabet used for the encoding. Can either be a list or a string: 'ACGT' or ['A, 'C', 'G', 'T']
+      seq_axis: axis along which the sequence runs
+      alphabet_axis: axis along which the alphabet runs. If None, the input is treated as an array of tokens.
+        Use negative axes to support batches.
+    """
+
+    def __init__(self, alphabet=DNA, seq_axis=-2, alphabet_axis=-1):
+        self.alphabet = parse_alphabet(alphabet)
+        self.seq_axis = seq_axis
+        self.alphabet_axis = alphabet_axis
+
+    def __call__(self, x):
+        if self.alphabet_axis is None:
+            return F.rc_tokens(x, self.alphabet, self.seq_axis)
+        else:
+            return F.rc_one_hot(x, self.alphabet, self.seq_axis, self.alphabet_axis)
+
+    def batch(self, x):
+        return ReverseComplement(self.alphabet, _batch_axis(self.seq_axis), _batch_axis(self.alphabet_axis))(x)
+
+
+class FusedOneHot(ReorderedOneHot):
+    """`OneHot` fused with the following layout transforms. Created by `Compose(..., compile=True)`.
+
+    The one-hot encoding is written directly into the final layout and dtype
+    using a single allocation. A `Cast` is only fused if the neutral value is
+    cast the same way as it's written by the one-hot encoding (e.g. `Cast(bool)`
+    turns 0.25 into True, whereas boolean one-hot arrays encode it with False).
+
+    # Arguments
+      one_hot: `OneHot` instance
+      transforms: list of `DummyAxis`, `SwapAxes`, `Cast` or `ReverseComplement`
+        transforms applied after `one_hot`
+    """
+
+    def __init__(self, one_hot, transforms=[]):
+        self.one_hot = one_hot
+        self.alphabet = parse_alphabet(one_hot.alphabet)
+        self.neutral_alphabet = one_hot.neutral_alphabet
+        self.neutral_value = one_hot.neutral_value
+        self.dtype = one_hot.dtype
+        self.transforms = []
+        self.output_axes = ('seq', 'alphabet')
+        self.reverse_complement = False
+        for t in transforms:
+            if not self.add(t):
+                raise ValueError("Transform {} can't be fused".format(t))
+
+    def add(self, t):
+        """Try to fuse another transform. Returns True if successful
+        """
+        axes = list(self.output_axes)
+
+        def valid(axis, ndim=len(axes)):
+            return -ndim <= axis < ndim
+
+        if isinstance(t, DummyAxis):
+            if t.axis is not None:
+                if not valid(t.axis, len(axes) + 1):
+                    return False
+                axes.insert(t.axis if t.axis >= 0 else len(axes) + 1 + t.axis, 'dummy')
+        elif isinstance(t, SwapAxes):
+            if t.axis1 is not None and t.axis2 is not None:
+                if not (valid(t.axis1) and valid(t.axis2)):
+                    return False
+                axes[t.axis1], axes[t.axis2] = axes[t.axis2], axes[t.axis1]
+        elif isinstance(t, Cast):
+            # the neutral value has to be cast the same way as it's written by the encoding
+            neutral_value = np.asarray(F.get_neutral_value(self.neutral_value, self.dtype), dtype=self.dtype)
+            if neutral_value.astype(t.dtype) != F.get_neutral_value(self.neutral_value, t.dtype):
+                return False
+            self.dtype = t.dtype
+        elif isinstance(t, ReverseComplement):
+            if t.alphabet_axis is None or list(t.alphabet) != list(self.alphabet) or \
+                    not (valid(t.seq_axis) and valid(t.alphabet_axis)) or \
+                    axes[t.seq_axis] != 'seq' or axes[t.alphabet_axis] != 'alphabet':
+                return False
+            self.reverse_complement = not self.reverse_complement
+        else:
+            return False
+        self.output_axes = tuple(axes)
+        self.transforms.append(t)
+        return True
+
+    def get_output_shape(self, seqlen=None):
+        sizes = {'seq': seqlen, 'alphabet': len(self.alphabet), 'dummy': 1}
+        return tuple(sizes[axis] for axis in self.output_axes)
+
+    def _encode(self, tokens, out=None):
+        if self.reverse_complement:
+            tokens = F.rc_tokens(tokens, self.alphabet)
+        return super(FusedOneHot, self)._encode(tokens, out)
+
+    def __repr__(self):
+        return "FusedOneHot({})".format(", ".join([t.__class__.__name__ for t in [self.one_hot] + self.transforms]))
+
+
+def _fuse_transforms(transforms):
+    """Fuse `OneHot` with the directly following transforms where possible
+    """
+    stages = []
+    for t in transforms:
+        if type(t) is OneHot:
+            stages.append(FusedOneHot(t))
+        elif stages and isinstance(stages[-1], FusedOneHot) and stages[-1].add(t):
+            continue
+        else:
+            stages.append(t)
+    return stages
+
+
+# Caching
+
+class LRUCache(object):
+    """Least-recently-used cache of numpy arrays bounded by the total number of bytes
+
+    Stored arrays are made read-only, since the same object is returned on every hit.
+
+    # Arguments
+      max_bytes: maximum total size of the cached arrays in bytes
+    """
+
+    def __init__(self, max_bytes=2 ** 30):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                arr = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return arr
+
+    def put(self, key, arr):
+        """Store the array. Arrays larger than `max_bytes` are not stored.
+
+        # Returns
+          the read-only array
+        """
+        arr = np.asarray(arr)
+        arr.setflags(write=False)
+        if arr.nbytes > self.max_bytes:
+            return arr
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key).nbytes
+            self._data[key] = arr
+            self.nbytes += arr.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+        return arr
+
+    def get_or_compute(self, key, fn):
+        """Return the cached array for `key` or compute and cache it with `fn()`
+        """
+        arr = self.get(key)
+        if arr is None:
+            arr = self.put(key, fn())
+        return arr
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def get_stats(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._data),
+                "nbytes": self.nbytes}
+
+
+def file_identity(path):
+    """Identify the file by its real path, size and modification time
+    """
+    stat = os.stat(path)
+    return (os.path.realpath(path), stat.st_size, stat.st_mtime)
+
+
+def _transform_key(transform):
+    """Key identifying the transform by its class and parameters
+
+    Transforms which can't be pickled get a unique key per instance.
+    """
+    try:
+        state = pickle.dumps(transform, protocol=4)
+    except Exception:
+        return (type(transform).__qualname__, os.urandom(16))
+    return (type(transform).__qualname__, hashlib.blake2b(state, digest_size=16).digest())
+
+
+class CachedTransform(object):
+    """Memoize a sequence transform (e.g. `OneHot` or `ReorderedOneHot`)
+
+    The transformed sequences are cached in a `LRUCache` and returned as read-only arrays.
+    Sequences (`str` or `PackedSeq`) are keyed by their hash. Use `extract` to key the
+    sequences by the interval and the fasta file instead. All keys include the identity
+    of the transform (its class and parameters), so a cache can be shared by different
+    transforms.
+
+    # Arguments
+      transform: callable transforming a sequence into a numpy array
+      max_bytes: maximum size of the cache in bytes
+      cache: `LRUCache` instance to use (can be shared). If specified, `max_bytes` is ignored.
+    """
+
+    def __init__(self, transform, max_bytes=2 ** 30, cache=None):
+        self.transform = transform
+        self.cache = cache if cache is not None else LRUCache(max_bytes)
+        self._namespace = _transform_key(transform)
+
+    def __call__(self, seq):
+        h = hashlib.blake2b(digest_size=16)
+        if isinstance(seq, F.PackedSeq):
+            h.update(str(seq.length).encode("ascii"))
+            h.update(seq.data.tobytes())
+            h.update(seq.mask.tobytes())
+        else:
+            h.update(seq.encode("ascii"))
+        key = (self._namespace, type(seq).__name__, h.digest())
+        return self.cache.get_or_compute(key, lambda: self.transform(seq))
+
+    def extract(self, extractor, interval):
+        """Extract the sequence using `extractor` (e.g. `FastaStringExtractor`) and transform it.
+
+        The cache key consists of the interval and the extractor's fasta file identity
+        (path, size and modification time), so the sequence is not read again on a hit.
+        """
+        fasta_file = getattr(extractor, "fasta_file", None)
+        key = (self._namespace,
+               file_identity(fasta_file) if fasta_file is not None else id(extractor),
+               getattr(extractor, "use_strand", None), getattr(extractor, "force_upper", None),
+               interval.chrom, interval.start, interval.end, interval.strand)
+        return self.cache.get_or_compute(key, lambda: self.transform(extractor.extract(interval)))
+
+    def get_stats(self):
+        return self.cache.get_stats()
+
+
 # Splicing
 
 class SplitSplicingSeq(object):
@@ -283,7 +707,6 @@ class SplitSplicingSeq(object):
         donor = x[(-intron3prime_len - self.donor_exon_len):(-intron3prime_len + self.donor_intron_len)]
         intron3prime = x[-intron3prime_len + self.intron3prime_cut:]
 
-        import warnings
         if donor[self.donor_exon_len:self.donor_exon_len + 2] != "GT":
             warnings.warn("None GT donor", UserWarning)
         if acceptor[self.acceptor_intron_len - 2:self.acceptor_intron_len] != "AG":
@@ -298,3 +721,100 @@ class SplitSplicingSeq(object):
             "donor": donor,
             "intron3prime": intron3prime
         }
+
+    def batch(self,
+              seqs,
+              intron5prime_len,
+              intron3prime_len
+              ):
+        """Split many sequences at once
+
+        # Arguments
+            seqs: list of sequences to split
+            intron5prime_len: 5' intronic sequence length(s) to take. int or array of length `len(seqs)`
+            intron3prime_len: 3' intronic sequence length(s) to take. int or array of length `len(seqs)`
+
+        # Returns
+            dict with:
+              - 'intron5prime', 'acceptor', 'exon', 'donor', 'intron3prime': uint8 arrays of ascii codes
+                of shape `(len(seqs), max_length)` padded with N at the end
+              - 'lengths': dict with the actual length of each segment
+              - 'non_gt_donor', 'non_ag_acceptor': boolean masks of the sequences with a
+                non-canonical donor or acceptor site. No warnings are raised.
+        """
+        n_seqs = len(seqs)
+        intron5prime_len = np.broadcast_to(np.asarray(intron5prime_len, dtype=int), (n_seqs,))
+        intron3prime_len = np.broadcast_to(np.asarray(intron3prime_len, dtype=int), (n_seqs,))
+        lens = np.array([len(seq) for seq in seqs], dtype=int)
+
+        # pad N if the flanking sequences are not long enough
+        lackl = self.acceptor_intron_len - intron5prime_len
+        pad_left = np.where(lackl >= 0, lackl + 1, 0)
+        intron5prime_len = intron5prime_len + pad_left
+        lackr = self.donor_intron_len - intron3prime_len
+        pad_right = np.where(lackr >= 0, lackr + 1, 0)
+        intron3prime_len = intron3prime_len + pad_right
+
+        # all the padded sequences concatenated into a single buffer
+        padded_lens = pad_left + lens + pad_right
+        offsets = np.cumsum(padded_lens) - padded_lens
+        buf = np.full(padded_lens.sum(), ord("N"), dtype=np.uint8)
+        buf[np.repeat(offsets + pad_left - (np.cumsum(lens) - lens), lens) + np.arange(lens.sum())] = \
+            np.frombuffer("".join(seqs).encode("ascii"), dtype=np.uint8)
+
+        # same slices as in __call__
+        i5, i3 = intron5prime_len, intron3prime_len
+        segments = OrderedDict([
+            ("intron5prime", (0, i5 - self.intron5prime_cut)),
+            ("acceptor", (i5 - self.acceptor_intron_len, i5 + self.acceptor_exon_len)),
+            ("exon", (i5 + self.exon_cut_l, -i3 - self.exon_cut_r)),
+            ("donor", (-i3 - self.donor_exon_len, -i3 + self.donor_intron_len)),
+            ("intron3prime", (-i3 + self.intron3prime_cut, padded_lens)),
+        ])
+        ret = OrderedDict()
+        lengths = OrderedDict()
+        starts = {}
+        for name, (start, stop) in segments.items():
+            starts[name], lengths[name] = _slice_bounds(start, stop, padded_lens)
+        for name in segments:
+            # empty exons are replaced by 'N' (the padding value)
+            ret[name] = _gather_segments(buf, offsets + starts[name], lengths[name],
+                                         min_width=1 if name == "exon" else 0)
+        lengths["exon"] = np.maximum(lengths["exon"], 1)
+        ret["lengths"] = lengths
+
+        # check the splice sites
+        for key, name, site_start, consensus in [
+                ("non_gt_donor", "donor", self.donor_exon_len, "GT"),
+                ("non_ag_acceptor", "acceptor", self.acceptor_intron_len - 2, "AG")]:
+            site_start, site_len = _slice_bounds(site_start, site_start + 2, lengths[name])
+            site_pos = offsets + starts[name] + site_start
+            canonical = site_len == 2
+            for i, c in enumerate(consensus):
+                canonical &= buf[np.minimum(site_pos + i, len(buf) - 1)] == ord(c)
+            ret[key] = ~canonical
+        return ret
+
+
+def _slice_bounds(start, stop, length):
+    """Vectorized python slice semantics of `x[start:stop]` for `len(x) == length`
+
+    # Returns
+        tuple of arrays: (start, length of the slice)
+    """
+    start, stop, length = np.broadcast_arrays(start, stop, length)
+    start = np.clip(np.where(start < 0, start + length, start), 0, length)
+    stop = np.clip(np.where(stop < 0, stop + length, stop), 0, length)
+    return start, np.maximum(stop - start, 0)
+
+
+def _gather_segments(buf, starts, lengths, value=ord("N"), min_width=0):
+    """Gather `buf[start:start + length]` for each segment into a padded uint8 matrix
+    with at least `min_width` columns
+    """
+    width = max(lengths.max() if len(lengths) else 0, min_width)
+    pos = np.arange(width)
+    valid = pos < lengths[:, np.newaxis]
+    out = np.full((len(lengths), width), value, dtype=np.uint8)
+    out[valid] = buf[(starts[:, np.newaxis] + pos)[valid]]
+    return out
@@ -34,6 +34,10 @@ def parse_dtype(dtype):
         try:
             return eval(dtype)
         except Exception as e:
-            raise ValueError("Unable to parse dtype: {}. \nException: {}".format(dtype, e))
+            try:
+                # numpy type names like 'float16', 'int8' or 'uint8'
+                return np.dtype(dtype).type
+            except TypeError:
+                raise ValueError("Unable to parse dtype: {}. \nException: {}".format(dtype, e))
     else:
         return dtype
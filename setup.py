@@ -33,6 +33,8 @@ test_requirements = [
     "scikit-learn",
     "cython",
     "cyvcf2",
+    "pyBigWig",
+    "biopython",
     # "genomelake",
     "keras",
     "tensorflow",
@@ -48,6 +50,8 @@ setup(
     url='https://github.com/kipoi/kipoiseq',
     long_description="kipoiseq: sequence-based data-laoders for Kipoi",
     packages=find_packages(),
+    # asyncio.get_running_loop (3.7), multiprocessing.shared_memory (3.8)
+    python_requires=">=3.8",
     install_requires=requirements,
     extras_require={
         "develop": test_requirements,
@@ -39,6 +39,16 @@ def test_bed3_labels(tmpdir):
     assert len(bt) == 2
 
 
+def test_resize(tmpdir):
+    bed_file = write_tmp('chr1\t10\t20\t1\nchr1\t15\t16\t0', tmpdir)
+    bt = BedDataset(bed_file)
+    bt.resize(4, anchor='center')
+    assert bt[0][0] == Interval("chr1", 13, 17)
+    assert bt[1][0] == Interval("chr1", 13, 17)
+    bt.resize(2, anchor='start')
+    assert bt[0][0] == Interval("chr1", 13, 15)
+
+
 def test_incl_excl_chromosomes(tmpdir):
     bed_file = write_tmp('chr1\t1\t2\t1\t0\nchr2\t1\t3\t0\t1\nchr3\t1\t3\t0\t1', tmpdir)
     bt = BedDataset(bed_file)
@@ -1,3 +1,4 @@
+import gc
 import os
 import numpy as np
 import pytest
@@ -6,6 +7,7 @@ from pybedtools import Interval
 from kipoi.utils import override_default_kwargs
 from kipoiseq.transforms.functional import one_hot_dna
 from kipoiseq.dataloaders.sequence import StringSeqIntervalDl, SeqIntervalDl, BedDataset
+from kipoiseq.extractors import SharedMemoryFastaExtractor
 
 
 @pytest.fixture
@@ -64,6 +66,32 @@ def test_seq_dataset(intervals_file, fasta_file):
     assert isinstance(ret_val["inputs"], np.ndarray)
     assert ret_val["inputs"].shape == (2, 4)
 
+    # the shared memory genome is encoded directly as well
+    dl_shm = SeqIntervalDl(intervals_file, fasta_file, shared_memory=True)
+    try:
+        for i in range(len(dl)):
+            ret_shm = dl_shm[i]
+            np.testing.assert_array_equal(dl[i]["inputs"], ret_shm["inputs"])
+            assert ret_shm["metadata"]["ranges"] == dl[i]["metadata"]["ranges"]
+        assert dl_shm.fasta_extractor.fasta_extractor is dl_shm.seq_dl.fasta_extractors
+    finally:
+        dl_shm.seq_dl.fasta_extractors.close()
+
+
+def test_fasta_based_dataset_shared_memory(intervals_file, fasta_file):
+    dl = StringSeqIntervalDl(intervals_file, fasta_file, shared_memory=True)
+    ref = StringSeqIntervalDl(intervals_file, fasta_file)
+    assert dl.fasta_extractors.is_owner
+    assert [str(dl[i]["inputs"]) for i in range(len(dl))] == \
+        [str(ref[i]["inputs"]) for i in range(len(ref))]
+
+    # the segment is unlinked once the dataloader is garbage collected
+    name = dl.fasta_extractors.name
+    del dl
+    gc.collect()
+    with pytest.raises(FileNotFoundError):
+        SharedMemoryFastaExtractor.attach(name)
+
 
 @pytest.fixture
 def example_kwargs():
@@ -1,9 +1,10 @@
 import pytest
+import numpy as np
 from cyvcf2 import VCF
-from pyfaidx import Sequence
 from pybedtools import Interval
 from kipoiseq.extractors.vcf_seq import IntervalSeqBuilder, VariantQueryable
 from kipoiseq.extractors import *
+from kipoiseq.transforms.functional import one_hot, one_hot_dna
 
 fasta_file = 'tests/data/sample.5kb.fa'
 vcf_file = 'tests/data/test.vcf.gz'
@@ -121,42 +122,22 @@ def test_VariantQueryable_to_vcf(tmpdir, variant_queryable):
 @pytest.fixture
 def interval_seq_builder():
     return IntervalSeqBuilder([
-        Interval('chr1', 10, 13),
-        Interval('chr1', 13, 14),
-        Sequence(seq='TAGC', start=14, end=18),
-        Interval('chr1', 18, 20)
+        (b'', 10, 13),
+        (b'', 13, 14),
+        (b'TAGC', 18, 20)
     ])
 
 
-def test_interval_seq_builder_restore(interval_seq_builder):
-    sequence = Sequence(seq='CCCCATCGTT', start=10, end=20)
-    interval_seq_builder.restore(sequence)
-    assert interval_seq_builder[0].seq == 'CCC'
-    assert interval_seq_builder[1].seq == 'C'
-    assert interval_seq_builder[2].seq == 'TAGC'
-    assert interval_seq_builder[3].seq == 'TT'
-
-    interval_seq_builder.append(Interval('chr1', 5, 10))
-    interval_seq_builder.restore(sequence)
-    assert interval_seq_builder[4].seq == ''
-
-    interval_seq_builder.append(Interval('chr1', 20, 25))
-    interval_seq_builder.restore(sequence)
-    assert interval_seq_builder[5].seq == ''
-
-    interval_seq_builder.append(Interval('chr1', 10, 5))
-    interval_seq_builder.restore(sequence)
-    assert interval_seq_builder[6].seq == ''
+def test_interval_seq_builder_concat(interval_seq_builder):
+    reference = b'CCCCATCGTT'
+    assert interval_seq_builder.concat(reference, 10) == b'CCCCTAGCTT'
 
-    interval_seq_builder.append(Interval('chr1', 25, 20))
-    interval_seq_builder.restore(sequence)
-    assert interval_seq_builder[7].seq == ''
+    # regions outside of the reference or with end < start are empty
+    for region in [(b'', 5, 10), (b'', 20, 25), (b'', 10, 5), (b'', 25, 20)]:
+        assert IntervalSeqBuilder([region]).concat(reference, 10) == b''
 
-
-def test_interval_seq_builder_concat(interval_seq_builder):
-    sequence = Sequence(seq='CCCCATCGNN', start=10, end=20)
-    interval_seq_builder.restore(sequence)
-    assert interval_seq_builder.concat() == 'CCCCTAGCNN'
+    reference = b'CCCCATCGNN'
+    assert interval_seq_builder.concat(reference, 10) == b'CCCCTAGCNN'
 
 
 @pytest.fixture
@@ -165,23 +146,18 @@ def variant_seq_extractor():
 
 
 def test__split_overlapping(variant_seq_extractor):
-    pair = (Sequence(seq='AAA', start=3, end=6),
-            Sequence(seq='T', start=3, end=4))
+    # (start, end, alt): ref AAA at 3-6 -> T
+    pair = (3, 6, b'T')
     splited_pairs = list(variant_seq_extractor._split_overlapping([pair], 5))
 
-    assert splited_pairs[0][0].seq == 'AA'
-    assert splited_pairs[0][1].seq == 'T'
-    assert splited_pairs[1][0].seq == 'A'
-    assert splited_pairs[1][1].seq == ''
+    assert splited_pairs[0] == (3, 5, b'T')
+    assert splited_pairs[1] == (5, 6, b'')
 
-    pair = (Sequence(seq='TT', start=3, end=5),
-            Sequence(seq='AAA', start=3, end=6))
+    pair = (3, 5, b'AAA')
     splited_pairs = list(variant_seq_extractor._split_overlapping([pair], 4))
 
-    assert splited_pairs[0][0].seq == 'T'
-    assert splited_pairs[0][1].seq == 'A'
-    assert splited_pairs[1][0].seq == 'T'
-    assert splited_pairs[1][1].seq == 'AA'
+    assert splited_pairs[0] == (3, 4, b'A')
+    assert splited_pairs[1] == (4, 5, b'AA')
 
 
 def test_extract(variant_seq_extractor):
@@ -244,6 +220,23 @@ def test_extract(variant_seq_extractor):
     assert seq == 'ACG'
 
 
+def test_aextract_batch(variant_seq_extractor):
+    import asyncio
+    variants = list(VCF(vcf_file)())
+    intervals = [Interval('chr1', 2, 9), Interval('chr1', 2, 9, strand='-'),
+                 Interval('chr1', 4, 14), Interval('chr1', 24, 34)]
+    anchors = [5, 5, 7, 27]
+
+    async def run(anchor):
+        return [seq async for seq in variant_seq_extractor.aextract_batch(
+            intervals, [variants] * len(intervals), anchor, max_concurrency=2)]
+
+    assert asyncio.run(run(anchors)) == ['CGAACGT', 'ACGTTCG', 'AACGTAACGT', 'TGATAACGTA']
+    assert asyncio.run(run(5)) == [variant_seq_extractor.extract(i, variants, anchor=5)
+                                   for i in intervals]
+    assert asyncio.run(variant_seq_extractor.aextract(intervals[0], variants, anchor=5)) == 'CGAACGT'
+
+
 @pytest.fixture
 def single_variant_vcf_seq_extractor():
     return SingleVariantVCFSeqExtractor(fasta_file, vcf_file)
@@ -256,6 +249,71 @@ def test_single_variant_vcf_seq_extract(single_variant_vcf_seq_extractor):
     assert next(seqs) == 'GTGAACG'
 
 
+@pytest.mark.parametrize("fetch_once", [True, False])
+def test_single_variant_vcf_seq_extract_ref(single_variant_vcf_seq_extractor, fetch_once):
+    for interval in [Interval('chr1', 2, 9), Interval('chr1', 2, 9, strand='-')]:
+        for fixed_len in [True, False]:
+            expected = list(single_variant_vcf_seq_extractor.extract(
+                interval, anchor=3, fixed_len=fixed_len, fetch_once=False))
+            pairs = list(single_variant_vcf_seq_extractor.extract(
+                interval, anchor=3, fixed_len=fixed_len, fetch_once=fetch_once, return_ref=True))
+            assert [seq for ref, seq in pairs] == expected
+            ref = single_variant_vcf_seq_extractor.variant_extractor.fasta.extract(interval)
+            assert all(r == ref for r, seq in pairs)
+
+
+def test_extract_single_variants(variant_seq_extractor):
+    variants = list(VCF(vcf_file)())
+    for interval, anchor in [(Interval('chr1', 2, 9), 5), (Interval('chr1', 2, 9, strand='-'), 5),
+                             (Interval('chr1', 4, 14), 7), (Interval('chr1', 24, 34), 27)]:
+        for fixed_len in [True, False]:
+            expected = [variant_seq_extractor.extract(interval, [v], anchor, fixed_len)
+                        for v in variants]
+            assert variant_seq_extractor.extract_single_variants(
+                interval, variants, anchor, fixed_len) == expected
+            ref, seqs = variant_seq_extractor.extract_single_variants(
+                interval, variants, anchor, fixed_len, return_ref=True)
+            assert seqs == expected
+            assert ref == variant_seq_extractor.extract(interval, [], anchor, fixed_len)
+    assert variant_seq_extractor.extract_single_variants(Interval('chr1', 2, 9), [], 5) == []
+
+
+def test_variant_one_hot_extract(variant_seq_extractor):
+    extractor = VariantOneHotExtractor(fasta_file)
+    variants = list(VCF(vcf_file)())
+    for interval, anchor in [(Interval('chr1', 2, 9), 5), (Interval('chr1', 2, 9, strand='-'), 5),
+                             (Interval('chr1', 4, 14), 7), (Interval('chr1', 24, 34), 27),
+                             (Interval('chr1', 2, 9), 2), (Interval('chr1', 2, 9), 9)]:
+        ref_seq, seqs = variant_seq_extractor.extract_single_variants(
+            interval, variants, anchor, return_ref=True)
+        ref, alt = extractor.extract(interval, variants, anchor)
+        assert ref.shape == alt.shape == (len(variants), len(interval), 4)
+        np.testing.assert_array_equal(alt, np.stack([one_hot_dna(seq) for seq in seqs]))
+        np.testing.assert_array_equal(ref[0], one_hot_dna(ref_seq))
+        np.testing.assert_array_equal(ref[-1], ref[0])
+
+    ref, alt = extractor.extract(Interval('chr1', 2, 9), [], 5)
+    assert ref.shape == alt.shape == (0, 7, 4)
+
+    out = np.empty((len(variants), 7, 4), dtype=np.float32)
+    for strand in ['+', '-']:
+        interval = Interval('chr1', 2, 9, strand=strand)
+        ref, alt = extractor.extract(interval, variants, 5, out=out)
+        assert alt is out
+        seqs = variant_seq_extractor.extract_single_variants(interval, variants, 5)
+        np.testing.assert_array_equal(out, np.stack([one_hot_dna(seq) for seq in seqs]))
+
+    # alphabet without a reverse-complement view
+    extractor = VariantOneHotExtractor(fasta_file, alphabet='ATCG')
+    interval = Interval('chr1', 2, 9, strand='-')
+    ref, alt = extractor.extract(interval, variants, 5, out=out)
+    assert alt is out
+    seqs = variant_seq_extractor.extract_single_variants(interval, variants, 5)
+    np.testing.assert_array_equal(out, np.stack([one_hot(seq, alphabet=list('ATCG')) for seq in seqs]))
+    with pytest.raises(ValueError):
+        extractor.extract(Interval('chr1', 2, 10), variants, 5, out=out)
+
+
 @pytest.fixture
 def single_seq_vcf_seq_extractor():
     return SingleSeqVCFSeqExtractor(fasta_file, vcf_file)
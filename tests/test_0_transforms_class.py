@@ -1,8 +1,11 @@
+import warnings
 import pytest
 import numpy as np
 import copy
-from kipoiseq.transforms.transforms import Compose, OneHot, SplitSplicingSeq, ReorderedOneHot
+from kipoiseq.transforms.transforms import Compose, OneHot, SplitSplicingSeq, ReorderedOneHot, DummyAxis, SwapAxes, \
+    ReverseComplement, Cast, FusedOneHot
 from kipoiseq.utils import DNA
+from kipoiseq.transforms import functional as F
 from pybedtools import Interval
 
 
@@ -13,6 +16,60 @@ def test_compose():
     assert c("ACGT").shape == (4, 4)
 
 
+@pytest.mark.parametrize("transforms", [
+    [OneHot()],
+    [OneHot(), DummyAxis(0), SwapAxes(0, 2)],
+    [OneHot(dtype=np.float32), SwapAxes(0, 1), DummyAxis(1), Cast(np.float16)],
+    [OneHot(), ReverseComplement(), DummyAxis(-1)],
+    [OneHot(), SwapAxes(0, 1), ReverseComplement(seq_axis=-1, alphabet_axis=-2)],
+    [OneHot(), DummyAxis(1), ReverseComplement(seq_axis=0, alphabet_axis=1), Cast(int)],
+])
+def test_compose_compile(transforms):
+    seqs = ["ACGTN", "TTNAC"]
+    c = Compose(transforms)
+    cc = Compose(transforms, compile=True)
+    assert isinstance(cc.stages[0], FusedOneHot)
+    for seq in seqs:
+        expected = c(seq)
+        out = cc(seq)
+        assert out.dtype == expected.dtype
+        assert np.array_equal(out, expected)
+        assert out.flags['C_CONTIGUOUS']
+
+    batch = cc.batch(seqs)
+    assert np.array_equal(batch, np.stack([c(seq) for seq in seqs]))
+    assert np.array_equal(c.batch(seqs), batch)
+
+
+def test_compose_compile_partial():
+    c = Compose([OneHot(), ReverseComplement(seq_axis=0, alphabet_axis=1), DummyAxis(0), SwapAxes(0, 1)],
+                compile=True)
+    assert len(c.stages) == 1
+    # the reverse-complement axes don't match the layout at that point
+    c = Compose([OneHot(), DummyAxis(0), ReverseComplement(seq_axis=0, alphabet_axis=1)], compile=True)
+    assert len(c.stages) == 2
+    assert np.array_equal(c("ACGT"), Compose(c.transforms)("ACGT"))
+    assert c.batch(["ACGT"]).shape == (1, 1, 4, 4)
+
+    # Cast(bool) turns the neutral value 0.25 into True
+    c = Compose([OneHot(), Cast(bool)], compile=True)
+    assert len(c.stages) == 2
+    assert np.array_equal(c("ACGTN"), Compose(c.transforms)("ACGTN"))
+    assert len(Compose([OneHot(), Cast(np.float16)], compile=True).stages) == 1
+
+
+def test_compose_profile():
+    c = Compose([OneHot(), DummyAxis(0)], profile=True)
+    c("ACGT")
+    c.batch(["ACGT", "ACGT"])
+    stats = c.get_stats()
+    assert list(stats) == ["0_OneHot", "1_DummyAxis"]
+    assert stats["0_OneHot"]["calls"] == 2
+    assert stats["0_OneHot"]["time"] >= 0
+    c.reset_stats()
+    assert c.get_stats()["1_DummyAxis"]["calls"] == 0
+
+
 def test_ReorderedOneHot():
     seqlen = 10
     seq = 'A' * seqlen
@@ -39,6 +96,74 @@ def test_ReorderedOneHot():
         ReorderedOneHot(dummy_axis=1)
 
 
+@pytest.mark.parametrize("alphabet_axis,dummy_axis,swap", [(1, None, None), (0, None, (1, 0)), (2, 1, None),
+                                                           (0, 1, (2, 0)), (0, 2, (1, 0)), (1, 0, (2, 1))])
+def test_ReorderedOneHot_layout(alphabet_axis, dummy_axis, swap):
+    seq = "ACGTNNTGA"
+    tr = ReorderedOneHot(alphabet_axis=alphabet_axis, dummy_axis=dummy_axis, dtype=np.float32)
+    out = tr(seq)
+    assert out.flags['C_CONTIGUOUS']
+    assert out.dtype == np.float32
+
+    swap = swap or (None, None)
+    expected = Compose([OneHot(), DummyAxis(dummy_axis), SwapAxes(*swap)])(seq)
+    assert np.array_equal(out, expected)
+
+
+def test_one_hot_packed_seq():
+    from kipoiseq.transforms.functional import string2packed
+    seq = "ACGTNNTGA"
+    assert np.array_equal(OneHot()(string2packed(seq)), OneHot()(seq))
+    tr = ReorderedOneHot(alphabet_axis=0, dummy_axis=1)
+    assert np.array_equal(tr(string2packed(seq)), tr(seq))
+
+
+@pytest.mark.parametrize("dtype", ["np.float16", "int8", "uint8", "bool"])
+def test_ReorderedOneHot_dtype(dtype):
+    tr = ReorderedOneHot(dtype=dtype, alphabet_axis=0)
+    out = tr("ACGTN")
+    assert out.dtype == np.dtype(dtype.replace("np.", ""))
+    assert np.array_equal(out[:, :4], np.eye(4))
+    assert np.all(out[:, 4] == (0.25 if dtype == "np.float16" else 0))
+
+
+def test_OneHot_batch():
+    seqs = ["ACGTN", "TTNAC"]
+    tr = OneHot(dtype=np.float32)
+    arr = tr.batch(seqs)
+    assert arr.shape == (2, 5, 4)
+    assert arr.dtype == np.float32
+    for i, seq in enumerate(seqs):
+        assert np.array_equal(arr[i], tr(seq))
+
+
+@pytest.mark.parametrize("alphabet_axis,dummy_axis", [(1, None), (0, None), (2, 1),
+                                                      (0, 1), (0, 2), (1, 2), (1, 0), (2, 0)])
+def test_ReorderedOneHot_batch(alphabet_axis, dummy_axis):
+    seqs = ["ACGTN", "TTNAC", "GATTA"]
+    tr = ReorderedOneHot(alphabet_axis=alphabet_axis, dummy_axis=dummy_axis)
+    arr = tr.batch(seqs)
+    assert arr.shape == (3,) + tr.get_output_shape(5)
+    for i, seq in enumerate(seqs):
+        assert np.array_equal(arr[i], tr(seq))
+
+    out = np.zeros_like(arr)
+    assert tr.batch(seqs, out=out) is out
+    assert np.array_equal(out, arr)
+
+
+def test_ReverseComplement():
+    from kipoiseq.transforms.functional import tokenize
+    tr = ReorderedOneHot(alphabet_axis=0, dummy_axis=1)
+    arr = tr.batch(["ACGTN", "TTNAC"])
+    rc = ReverseComplement(seq_axis=-1, alphabet_axis=-3)(arr)
+    assert np.array_equal(rc, tr.batch(["NACGT", "GTNAA"]))
+    assert np.shares_memory(rc, arr)
+
+    rc = ReverseComplement(seq_axis=-1, alphabet_axis=None)(tokenize("ACGTN"))
+    assert np.array_equal(rc, tokenize("NACGT"))
+
+
 def test_SplitSplicingSeq():
     split = SplitSplicingSeq(exon_cut_l=0,
                              exon_cut_r=0,
@@ -62,3 +187,97 @@ def test_SplitSplicingSeq():
 
 def test_ResizeInterval():
     pass
+
+
+def test_SplitSplicingSeq_batch():
+    split = SplitSplicingSeq(exon_cut_l=0,
+                             exon_cut_r=0,
+                             intron5prime_cut=3,
+                             intron3prime_cut=3,
+                             acceptor_intron_len=2,
+                             acceptor_exon_len=3,
+                             donor_exon_len=3,
+                             donor_intron_len=2
+                             )
+    seqs = ['TAAAGGTAGTAGAGTCCC', 'AGGTAGTCCC', 'CCCCCAAAAAACCCCC']
+    intron5prime_len = [5, 2, 5]
+    intron3prime_len = [5, 3, 5]
+    out = split.batch(seqs, intron5prime_len, intron3prime_len)
+
+    assert out['exon'].dtype == np.uint8
+    for i, seq in enumerate(seqs):
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            expected = split(seq, intron5prime_len[i], intron3prime_len[i])
+        for k, v in expected.items():
+            assert out[k][i, :out['lengths'][k][i]].tobytes().decode() == v
+        messages = [str(x.message) for x in w]
+        assert out['non_gt_donor'][i] == ("None GT donor" in messages)
+        assert out['non_ag_acceptor'][i] == ("None AG donor" in messages)
+    assert out['non_gt_donor'].sum() == 2
+
+
+def test_SplitSplicingSeq_batch_empty_exons():
+    # all the exons are cut away
+    split = SplitSplicingSeq(exon_cut_l=4, exon_cut_r=4, intron5prime_cut=3, intron3prime_cut=3,
+                             acceptor_intron_len=2, acceptor_exon_len=3,
+                             donor_exon_len=3, donor_intron_len=2)
+    seqs = ['TAAAGGTAGTAGAGTCCC', 'CCCCCAAAAAACCCCC']
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = [split(seq, 5, 5) for seq in seqs]
+    out = split.batch(seqs, 5, 5)
+    assert out['exon'].shape == (2, 1)
+    for i in range(len(seqs)):
+        assert expected[i]['exon'] == 'N'
+        assert out['exon'][i, :out['lengths']['exon'][i]].tobytes().decode() == 'N'
+
+
+def test_LRUCache():
+    from kipoiseq.transforms.transforms import LRUCache
+    cache = LRUCache(max_bytes=3 * 8)
+    for i in range(3):
+        cache.put(i, np.zeros(1))
+    assert cache.get(0) is not None
+    cache.put(3, np.zeros(1))  # evicts 1
+    assert 1 not in cache
+    assert cache.get(1) is None
+    assert cache.get_stats() == {"hits": 1, "misses": 1, "evictions": 1, "entries": 3, "nbytes": 24}
+
+    arr = cache.get_or_compute("big", lambda: np.zeros(10))
+    assert "big" not in cache
+    assert not arr.flags.writeable
+
+
+def test_CachedTransform():
+    from kipoiseq.transforms.transforms import CachedTransform
+    from kipoiseq.extractors import FastaStringExtractor
+    tr = CachedTransform(OneHot())
+    a = tr("ACGT")
+    assert tr("ACGT") is a
+    assert not a.flags.writeable
+    assert np.array_equal(a, OneHot()("ACGT"))
+    assert tr.get_stats()["hits"] == 1
+
+    extractor = FastaStringExtractor("tests/data/sample.fasta")
+    interval = Interval("chr1", 0, 4)
+    a = tr.extract(extractor, interval)
+    assert tr.extract(extractor, interval) is a
+    assert np.array_equal(a, OneHot()("ACGT"))
+    assert tr.get_stats()["misses"] == 2
+
+    packed = F.string2packed("ACGTN")
+    a = tr(packed)
+    assert tr(packed) is a
+    assert np.array_equal(a, OneHot()("ACGTN"))
+
+
+def test_CachedTransform_shared_cache():
+    from kipoiseq.transforms.transforms import CachedTransform, LRUCache
+    cache = LRUCache()
+    a = CachedTransform(OneHot(), cache=cache)("ACGTN")
+    b = CachedTransform(ReorderedOneHot(alphabet_axis=0), cache=cache)("ACGTN")
+    assert a.shape == (5, 4)
+    assert b.shape == (4, 5)
+    # equal transforms share the entries
+    assert CachedTransform(OneHot(), cache=cache)("ACGTN") is a
@@ -1,5 +1,6 @@
 import pytest
-from kipoiseq.transforms.functional import resize_interval, tokenize, token2one_hot, one_hot, one_hot_dna, pad, trim, fixed_len
+from kipoiseq.transforms.functional import resize_interval, resize_intervals, tokenize, token2one_hot, one_hot, one_hot_dna, pad, trim, fixed_len, \
+    fixed_len_batch, pad_batch, trim_batch, one_hot_batch, rc_one_hot, rc_tokens, one_hot2string, tokenize_kmers, kmer_alphabet, token2string, string2packed, packed2string, packed2token, PackedSeq
 from kipoiseq.transforms.transforms import ResizeInterval
 from kipoiseq.utils import DNA
 import numpy as np
@@ -13,6 +14,41 @@ def test_tokenize():
         tokenize("ACGTGATGA", ["ACG"], neutral_alphabet="NNN")
 
 
+def test_tokenize_table():
+    from kipoiseq.utils import AMINO_ACIDS
+    seq = "".join(AMINO_ACIDS) + "X-"
+    tokens = tokenize(seq, AMINO_ACIDS, neutral_alphabet=["X", "-"])
+    assert np.array_equal(tokens, list(range(len(AMINO_ACIDS))) + [-1, -1])
+
+    # neutral alphabet takes precedence
+    assert np.array_equal(tokenize("ACGT", DNA, neutral_alphabet="T"), [0, 1, 2, -1])
+    # non-ascii alphabets fall back to the dictionary lookup
+    assert np.array_equal(tokenize("A\u00e4C", ["A", "\u00e4", "C"]), [0, 1, 2])
+
+    with pytest.raises(KeyError):
+        tokenize("ACGTX", DNA, neutral_alphabet="N")
+
+
+def test_tokenize_kmers():
+    seq = "ACGTGATGANTT"
+    codons = kmer_alphabet(3)
+    assert len(codons) == 64
+    # non-overlapping k-mers match the striding `tokenize`
+    assert np.array_equal(tokenize_kmers(seq, 3, stride=3), tokenize(seq, codons, neutral_alphabet=["NTT"]))
+
+    # overlapping k-mers
+    tokens = tokenize_kmers(seq, 2)
+    assert len(tokens) == len(seq) - 1
+    expected = [kmer_alphabet(2).index(seq[i:i + 2]) if "N" not in seq[i:i + 2] else -1
+                for i in range(len(seq) - 1)]
+    assert np.array_equal(tokens, expected)
+
+    assert np.array_equal(tokenize_kmers(string2packed(seq), 2), tokens)
+    assert len(tokenize_kmers("AC", 3)) == 0
+    with pytest.raises(ValueError):
+        tokenize_kmers(seq, 2, alphabet=["AC", "GT"])
+
+
 def test_token2one_hot():
     assert np.array_equal(token2one_hot(np.array([0, 1, -1]), 2), np.array([[1, 0],
                                                                             [0, 1],
@@ -65,6 +101,112 @@ def test_one_hot():
         one_hot_dna(['A', 'C'])
 
 
+@pytest.mark.parametrize("dtype", [np.float16, np.float32, np.int8, np.uint8, bool])
+def test_one_hot_dtype(dtype):
+    arr = one_hot_dna("ACGTN", dtype=dtype)
+    assert arr.dtype == dtype
+    assert np.array_equal(arr[:4], np.eye(4))
+    if np.dtype(dtype).kind == 'f':
+        assert np.all(arr[4] == 0.25)
+    else:
+        # fractional neutral values can't be represented
+        assert np.all(arr[4] == 0)
+    assert np.all(one_hot("N", neutral_value=1, dtype=dtype) == 1)
+
+
+def test_one_hot_batch():
+    seqs = ["ACGTN", "TTNAC", "GGGGG"]
+    arr = one_hot_batch(seqs)
+    assert arr.shape == (3, 5, 4)
+    for i, seq in enumerate(seqs):
+        assert np.array_equal(arr[i], one_hot(seq))
+
+    # re-use the buffer
+    out = np.ones((3, 5, 4), dtype=np.float32)
+    assert one_hot_batch(seqs, out=out) is out
+    assert np.array_equal(out, arr)
+
+    with pytest.raises(ValueError):
+        one_hot_batch(seqs, out=np.empty((3, 4, 4)))
+    with pytest.raises(ValueError):
+        one_hot_batch(["ACGT", "ACG"])
+    assert one_hot_batch([]).shape == (0, 0, 4)
+
+
+@pytest.mark.parametrize("seq", ["", "A", "ACGTN", "acgtNNNNGATTACAT", "ACGTRYKM" * 11])
+def test_packed_seq(seq):
+    packed = string2packed(seq)
+    assert isinstance(packed, PackedSeq)
+    assert len(packed) == len(seq)
+    assert packed.nbytes <= len(seq) // 4 + len(seq) // 8 + 2
+
+    expected = "".join([c if c in "ACGT" else "N" for c in seq.upper()])
+    assert packed2string(packed) == packed.to_string() == expected
+    assert np.array_equal(packed2token(packed), tokenize(expected))
+    assert np.array_equal(packed.to_one_hot(), one_hot(expected))
+    assert np.array_equal(one_hot(packed, dtype=np.float32), one_hot(expected, dtype=np.float32))
+    # different alphabet order
+    assert np.array_equal(packed2token(packed, "TGCA"), tokenize(expected, list("TGCA")))
+
+
+def test_packed_seq_one_hot_batch():
+    seqs = ["ACGTN", "ttnac"]
+    packed = [string2packed(s) for s in seqs]
+    assert np.array_equal(one_hot_batch(packed), one_hot_batch([s.upper() for s in seqs]))
+
+
+def test_one_hot2string():
+    seqs = ["ACGTN", "TTNAC", "GGGGG"]
+    arr = one_hot_batch(seqs)
+    assert one_hot2string(arr) == seqs
+    assert one_hot2string(arr[0]) == "ACGTN"
+    assert one_hot2string(arr.reshape((3, 1, 5, 4))) == [[s] for s in seqs]
+    assert one_hot2string(arr[:, :0]) == ["", "", ""]
+    assert one_hot2string(one_hot("TGCA", alphabet=list("TGCA")), alphabet=list("TGCA")) == "TGCA"
+
+    # neutral elements encoded with zeros
+    for dtype in [np.int8, np.uint8, bool]:
+        assert one_hot2string(one_hot("ACGN", dtype=dtype)) == "ACGN"
+    assert one_hot2string(one_hot("ACGN", neutral_value=0), neutral_value=0) == "ACGN"
+
+
+def test_token2string():
+    assert token2string(tokenize("ACGTN")) == "ACGTN"
+    assert token2string(np.array([[0, 1], [-1, 3]])) == ["AC", "NT"]
+    assert token2string(tokenize("ACGTGATGA", ["ACG", "TGA"], "NNN"), ["ACG", "TGA"], "NNN") == "ACGTGATGA"
+    assert token2string(np.array([0, -1]), ["ACG", "TGA"], "NNN") == "ACGNNN"
+
+
+def test_rc_one_hot():
+    seqs = ["ACGTN", "TTNAC"]
+    rc_seqs = ["NACGT", "GTNAA"]
+    arr = one_hot_batch(seqs)
+    rc = rc_one_hot(arr)
+    assert np.shares_memory(rc, arr)
+    assert one_hot2string(rc) == rc_seqs
+    assert np.array_equal(rc_one_hot(rc), arr)
+
+    # alphabet where the complement is not the reversed alphabet
+    alphabet = list("ATCG")
+    rc = rc_one_hot(one_hot_batch(seqs, alphabet=alphabet), alphabet=alphabet)
+    assert one_hot2string(rc, alphabet=alphabet) == rc_seqs
+
+    # (alphabet, seq) layout
+    rc = rc_one_hot(np.swapaxes(arr, 1, 2), seq_axis=-1, alphabet_axis=-2)
+    assert one_hot2string(np.swapaxes(rc, 1, 2)) == rc_seqs
+
+    with pytest.raises(ValueError):
+        rc_one_hot(one_hot("AC", alphabet=["A", "C"]), alphabet=["A", "C"])
+
+
+def test_rc_tokens():
+    tokens = tokenize("ACGTNT")
+    assert token2string(rc_tokens(tokens)) == "ANACGT"
+    assert token2string(rc_tokens(tokens[np.newaxis])) == ["ANACGT"]
+    rna = list("ACGU")
+    assert token2string(rc_tokens(tokenize("AACGU", rna), rna), rna) == "ACGUU"
+
+
 def test_fixed_len():
     seq = "ACGTTTATNT"
     assert len(fixed_len(seq, 20, value="N", anchor="end")) is 20
@@ -75,6 +217,31 @@ def test_fixed_len():
     assert fixed_len(seq, length=3, value="NNN", anchor="end") == "TNT"
 
 
+@pytest.mark.parametrize("anchor", ['start', 'end', 'center'])
+@pytest.mark.parametrize("length", [1, 3, 4, 10])
+def test_fixed_len_batch(anchor, length):
+    seqs = ["CTTACTCAGA", "TCTTTA", "ACG", "", "ACGT"]
+    arr = fixed_len_batch(seqs, length, anchor=anchor)
+    assert arr.shape == (len(seqs), length)
+    assert arr.dtype == np.uint8
+    for row, seq in zip(arr, seqs):
+        assert row.tobytes().decode() == fixed_len(seq, length, anchor=anchor)
+
+    assert np.array_equal(one_hot_batch(arr), one_hot_batch([fixed_len(s, length, anchor=anchor) for s in seqs]))
+
+
+def test_pad_trim_batch():
+    assert np.array_equal(pad_batch(["AC", "G"], 3, anchor="end"), fixed_len_batch(["AC", "G"], 3, anchor="end"))
+    assert np.array_equal(trim_batch(["ACGT", "GAT"], 2), fixed_len_batch(["ACGT", "GAT"], 2))
+    with pytest.raises(ValueError):
+        pad_batch(["ACGT"], 3)
+    with pytest.raises(ValueError):
+        trim_batch(["AC"], 3)
+    with pytest.raises(ValueError):
+        fixed_len_batch(["AC"], 3, value="NN")
+    assert fixed_len_batch([], 3).shape == (0, 3)
+
+
 def test_pad_sequences():
     seq = 'CTTACTCAGA'
     assert fixed_len(seq, 4, anchor="center", value="N") == 'ACTC'
@@ -116,6 +283,22 @@ def test_resize_interval(anchor, ilen):
         assert int((ret_inter.start + ret_inter.end) / 2) == dummy_center
 
 
+@pytest.mark.parametrize("anchor", ['start', 'end', 'center'])
+@pytest.mark.parametrize("ilen", [3, 4])
+def test_resize_intervals(anchor, ilen):
+    import pybedtools
+    starts = np.array([10, 11, 5, 100])
+    ends = np.array([20, 20, 6, 101])
+    new_starts, new_ends = resize_intervals(starts, ends, ilen, anchor)
+    assert np.all(new_ends - new_starts == ilen)
+    for start, end, new_start, new_end in zip(starts, ends, new_starts, new_ends):
+        interval = resize_interval(pybedtools.Interval('chr1', int(start), int(end)), ilen, anchor)
+        assert (interval.start, interval.end) == (new_start, new_end)
+
+    with pytest.raises(Exception):
+        resize_intervals(starts, ends, ilen, 'middle')
+
+
 def test_ResizeInterval():
     """Same test as before
     """
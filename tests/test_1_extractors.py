@@ -1,6 +1,7 @@
 from kipoiseq.extractors import FastaStringExtractor
 import pytest
 import numpy as np
+import pickle
 from pybedtools import Interval
 
 
@@ -29,3 +30,387 @@ def test_fastareader(use_strand, force_upper):
             assert seq == ref_seq.upper()
         else:
             assert seq == ref_seq
+
+
+@pytest.mark.parametrize("use_strand", [True, False])
+@pytest.mark.parametrize("force_upper", [True, False])
+@pytest.mark.parametrize("max_gap", [0, 100])
+def test_fastareader_extract_batch(tmpdir, use_strand, force_upper, max_gap):
+    fp = str(tmpdir.join("two_chrom.fa"))
+    with open(fp, "w") as f:
+        f.write(">chr1\n" + "ACGTacgtNNGATTACA" * 100 + "\n>chr2\n" + "TTGCA" * 20 + "\n")
+    fr = FastaStringExtractor(fp, use_strand, force_upper)
+    intervals = [Interval("chr1", 100, 200, strand="-"),
+                 Interval("chr1", 0, 50),
+                 Interval("chr1", 150, 300),
+                 Interval("chr2", 10, 20, strand="-"),
+                 Interval("chr1", 40, 45, strand="-"),
+                 Interval("chr1", 1000, 1010),
+                 Interval("chr1", 150, 300)]
+    assert fr.extract_batch(intervals, max_gap=max_gap) == [fr.extract(i) for i in intervals]
+    assert fr.extract_batch([]) == []
+
+
+def _extract_all(extractor, intervals):
+    return [extractor.extract(interval) for interval in intervals]
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_fastareader_threads_and_processes(tmpdir, start_method):
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    from multiprocessing import get_context, get_all_start_methods
+    import pickle
+
+    if start_method not in get_all_start_methods():
+        pytest.skip("{} not supported".format(start_method))
+    fp = str(tmpdir.join("crlf.fa"))
+    with open(fp, "w", newline="") as f:
+        f.write(">chr1 description\r\n" + "ACGTacgtNNGATTACAAC\r\n" * 50 + ">chr2\r\nTTGCA\r\n")
+    fr = FastaStringExtractor(fp, use_strand=True)
+    intervals = [Interval("chr1", i, i + 37, strand="+-"[i % 2]) for i in range(0, 900, 7)] + \
+        [Interval("chr2", 1, 10), Interval("chr1", 940, 960)]
+    expected = [str(fr.fasta.get_seq(i.chrom, i.start + 1, i.stop, rc=i.strand == "-").seq)
+                for i in intervals]
+
+    with ThreadPoolExecutor(8) as pool:
+        assert list(pool.map(fr.extract, intervals * 10)) == expected * 10
+
+    fr2 = pickle.loads(pickle.dumps(fr))
+    assert fr2._fasta is None
+    assert _extract_all(fr2, intervals) == expected
+
+    with ProcessPoolExecutor(2, mp_context=get_context(start_method)) as pool:
+        results = list(pool.map(_extract_all, [fr] * 4, [intervals] * 4))
+    assert results == [expected] * 4
+    # the parent can still read after the workers exited
+    assert _extract_all(fr, intervals) == expected
+
+    fr.close()
+    assert _extract_all(fr, intervals) == expected
+
+
+def _extract_into_queue(extractor, intervals, queue):
+    queue.put(_extract_all(extractor, intervals))
+
+
+def test_fastareader_fork_with_held_lock():
+    from multiprocessing import get_context, get_all_start_methods
+
+    if "fork" not in get_all_start_methods():
+        pytest.skip("fork not supported")
+    fr = FastaStringExtractor("tests/data/sample.5kb.fa")
+    intervals = [Interval("chr1", 0, 10), Interval("chr1", 100, 120)]
+    expected = _extract_all(fr, intervals)
+    ctx = get_context("fork")
+    queue = ctx.Queue()
+    # e.g. another thread reading at the time of fork
+    with fr._lock:
+        p = ctx.Process(target=_extract_into_queue, args=(fr, intervals, queue))
+        p.start()
+    try:
+        assert queue.get(timeout=30) == expected
+    finally:
+        p.join(timeout=5)
+        if p.is_alive():
+            p.kill()
+    assert p.exitcode == 0
+
+
+@pytest.mark.parametrize("packed", [True, False])
+@pytest.mark.parametrize("use_strand", [True, False])
+def test_memmap_fasta_extractor(tmpdir, packed, use_strand):
+    from kipoiseq.extractors import convert_fasta_to_memmap, MemmapFastaExtractor
+    import pickle
+
+    fp = str(tmpdir.join("two_chrom.fa"))
+    with open(fp, "w") as f:
+        f.write(">chr1\nACGTACGTNNGATTACA\nTTAGGCAT\n>chr2\n" + "TTGCA" * 20 + "\n>chr3\nACG\n")
+    store = str(tmpdir.join("store"))
+    manifest = convert_fasta_to_memmap(fp, store, packed=packed)
+    assert manifest["chromosomes"]["chr1"]["length"] == 25
+
+    fr = FastaStringExtractor(fp, use_strand=use_strand)
+    mr = MemmapFastaExtractor(store, use_strand=use_strand)
+    intervals = [Interval("chr1", 0, 25, strand="-"), Interval("chr1", 3, 11), Interval("chr1", 5, 6),
+                 Interval("chr2", 7, 99, strand="-"), Interval("chr3", 0, 3), Interval("chr1", 20, 30)]
+    for interval in intervals:
+        assert mr.extract(interval) == fr.extract(interval)
+        assert mr.extract_packed(interval).to_string() == fr.extract(interval)
+        assert fr.extract_packed(interval).to_string() == fr.extract(interval)
+    if packed:
+        # aligned slices are views of the store
+        assert not mr.extract_packed(Interval("chr2", 8, 99)).data.flags.writeable
+
+    arr = mr.extract_array(Interval("chr1", 3, 11))
+    assert arr.dtype == np.uint8
+    if not packed:
+        assert not arr.flags.writeable
+
+    mr2 = pickle.loads(pickle.dumps(mr))
+    assert mr2.extract(intervals[0]) == mr.extract(intervals[0])
+    with pytest.raises(KeyError):
+        mr.extract(Interval("chrX", 0, 3))
+
+
+def test_memmap_fasta_extractor_force_upper(tmpdir):
+    from kipoiseq.extractors import convert_fasta_to_memmap, MemmapFastaExtractor
+    store = str(tmpdir.join("store"))
+    convert_fasta_to_memmap("tests/data/sample.fasta", store)
+    interval = Interval("chr1", 2, 6, strand="-")
+    for use_strand in [True, False]:
+        for force_upper in [True, False]:
+            assert MemmapFastaExtractor(store, use_strand, force_upper).extract(interval) == \
+                FastaStringExtractor("tests/data/sample.fasta", use_strand, force_upper).extract(interval)
+
+
+def _extract_in_worker(extractor, interval):
+    return extractor.extract(interval)
+
+
+@pytest.mark.parametrize("packed", [True, False])
+def test_shared_memory_fasta_extractor(tmpdir, packed):
+    from kipoiseq.extractors import SharedMemoryFastaExtractor
+    from multiprocessing import get_context
+    import pickle
+
+    fp = str(tmpdir.join("two_chrom.fa"))
+    with open(fp, "w") as f:
+        f.write(">chr1\nACGTACGTNNGATTACA\nTTAGGCAT\n>chr2\n" + "TTGCA" * 20 + "\n>chr3\nACG\n")
+    fr = FastaStringExtractor(fp, use_strand=True)
+    sr = SharedMemoryFastaExtractor(fp, use_strand=True, packed=packed)
+    intervals = [Interval("chr1", 0, 25, strand="-"), Interval("chr1", 3, 11), Interval("chr1", 5, 6),
+                 Interval("chr2", 7, 99, strand="-"), Interval("chr3", 0, 3), Interval("chr1", 20, 30)]
+    try:
+        for interval in intervals:
+            assert sr.extract(interval) == fr.extract(interval)
+            assert sr.extract_packed(interval).to_string() == fr.extract(interval)
+
+        attached = SharedMemoryFastaExtractor.attach(sr.name, use_strand=True)
+        assert attached.packed == packed
+        assert not attached.is_owner
+        assert [attached.extract(i) for i in intervals] == [fr.extract(i) for i in intervals]
+        attached.close()
+
+        unpickled = pickle.loads(pickle.dumps(sr))
+        assert not unpickled.is_owner
+        assert unpickled.extract(intervals[0]) == fr.extract(intervals[0])
+        unpickled.close()
+
+        with get_context("spawn").Pool(2) as pool:
+            seqs = pool.starmap(_extract_in_worker, [(sr, i) for i in intervals])
+        assert seqs == [fr.extract(i) for i in intervals]
+        with pytest.raises(KeyError):
+            sr.extract(Interval("chrX", 0, 3))
+    finally:
+        sr.close()
+    with pytest.raises(FileNotFoundError):
+        SharedMemoryFastaExtractor.attach(sr.name)
+
+
+def test_shared_memory_fasta_extractor_gc(tmpdir):
+    from kipoiseq.extractors import SharedMemoryFastaExtractor
+    import gc
+
+    fp = str(tmpdir.join("chrom.fa"))
+    with open(fp, "w") as f:
+        f.write(">chr1\nACGTACGTNNGATTACA\n")
+    sr = SharedMemoryFastaExtractor(fp)
+    name = sr.name
+    assert sr.extract(Interval("chr1", 0, 4)) == "ACGT"
+    del sr
+    gc.collect()
+    with pytest.raises(FileNotFoundError):
+        SharedMemoryFastaExtractor.attach(name)
+
+
+@pytest.mark.parametrize("use_strand", [True, False])
+@pytest.mark.parametrize("alphabet_axis,dummy_axis", [(1, None), (0, None), (0, 1), (1, 2), (2, 0)])
+def test_fasta_one_hot_extractor(tmpdir, use_strand, alphabet_axis, dummy_axis):
+    from kipoiseq.extractors import FastaOneHotExtractor
+    from kipoiseq.transforms import ReorderedOneHot
+
+    fp = str(tmpdir.join("two_chrom.fa"))
+    with open(fp, "w") as f:
+        f.write(">chr1\n" + "ACGTacgtNNGATTACAn\n" * 20 + ">chr2\nTTGCA\n")
+    kwargs = dict(dtype=np.float32, alphabet_axis=alphabet_axis, dummy_axis=dummy_axis)
+    ex = FastaOneHotExtractor(fp, use_strand=use_strand, **kwargs)
+    fr = FastaStringExtractor(fp, use_strand=use_strand, force_upper=True)
+    one_hot = ReorderedOneHot(**kwargs)
+    intervals = [Interval("chr1", i, i + 25, strand="+-"[i % 2]) for i in range(0, 300, 13)]
+
+    out = ex.extract_batch(intervals)
+    assert out.dtype == np.float32
+    assert out.shape == (len(intervals),) + one_hot.get_output_shape(25)
+    np.testing.assert_array_equal(out, one_hot.batch([fr.extract(i) for i in intervals]))
+    # re-use the output array
+    assert ex.extract_batch(intervals, out=out) is out
+    np.testing.assert_array_equal(ex.extract(intervals[1]), one_hot(fr.extract(intervals[1])))
+
+    tokens = ex.extract_tokens_batch(intervals)
+    assert tokens.shape == (len(intervals), 25)
+    np.testing.assert_array_equal(ex.extract_tokens(intervals[3]), tokens[3])
+
+    # sequence truncated at the chromosome end
+    assert len(ex.extract_tokens(Interval("chr2", 2, 10))) == 3
+    with pytest.raises(ValueError):
+        ex.extract_batch([Interval("chr2", 0, 5), Interval("chr2", 2, 7)])
+
+    # read from other extractors
+    from kipoiseq.extractors import convert_fasta_to_memmap, MemmapFastaExtractor, SharedMemoryFastaExtractor
+    store = str(tmpdir.join("store"))
+    convert_fasta_to_memmap(fp, store)
+    sources = [FastaStringExtractor(fp, use_strand=True), MemmapFastaExtractor(store, force_upper=True),
+               SharedMemoryFastaExtractor(fp)]
+    try:
+        for source in sources:
+            ex2 = FastaOneHotExtractor(source, use_strand=use_strand, **kwargs)
+            np.testing.assert_array_equal(ex2.extract_batch(intervals), out)
+            ex2.close()
+        # not closed by the one-hot extractor
+        assert sources[-1].extract(intervals[0]) == FastaStringExtractor(fp).extract(intervals[0])
+    finally:
+        sources[-1].close()
+
+
+@pytest.fixture
+def bigwig_file(tmpdir):
+    pyBigWig = pytest.importorskip("pyBigWig")
+    fp = str(tmpdir.join("signal.bw"))
+    bw = pyBigWig.open(fp, "w")
+    bw.addHeader([("chr1", 1000), ("chr2", 50)])
+    # chr1: value i / 10 at position i, except for a gap without data at 500-600
+    starts = [i for i in range(1000) if not 500 <= i < 600]
+    bw.addEntries(["chr1"] * len(starts), starts, ends=[i + 1 for i in starts],
+                  values=[i / 10. for i in starts])
+    bw.addEntries("chr2", 0, values=[1.] * 50, span=1, step=1)
+    bw.close()
+    return fp
+
+
+def _expected_signal(chrom, start, end):
+    pos = np.arange(start, end)
+    if chrom == "chr2":
+        return np.where((pos >= 0) & (pos < 50), 1., np.nan)
+    return np.where((pos >= 0) & (pos < 1000) & ~((pos >= 500) & (pos < 600)), pos / 10., np.nan)
+
+
+@pytest.mark.parametrize("block_size", [7, 128, 2 ** 16])
+def test_bigwig_extractor(bigwig_file, block_size):
+    from kipoiseq.extractors import BigWigExtractor
+    import pickle
+
+    intervals = [Interval("chr1", 0, 100), Interval("chr1", 490, 590), Interval("chr1", 950, 1050),
+                 Interval("chr2", 30, 130), Interval("chr1", 37, 137)]
+    expected = np.stack([_expected_signal(i.chrom, i.start, i.stop) for i in intervals])
+
+    ex = BigWigExtractor(bigwig_file, nan_value=None, block_size=block_size)
+    out = ex.extract_batch(intervals)
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out, expected, rtol=1e-6)
+    np.testing.assert_allclose(ex.extract(intervals[1]), expected[1], rtol=1e-6)
+
+    ex = BigWigExtractor(bigwig_file, block_size=block_size)
+    np.testing.assert_allclose(ex.extract_batch(intervals), np.nan_to_num(expected), rtol=1e-6)
+    # adjacent windows are served from the cache
+    misses = ex.cache.get_stats()["misses"]
+    ex.extract_batch(intervals)
+    assert ex.cache.get_stats()["misses"] == misses
+
+    ex = BigWigExtractor(bigwig_file, bin_size=10, block_size=block_size)
+    binned = ex.extract_batch(intervals)
+    assert binned.shape == (len(intervals), 10)
+    np.testing.assert_allclose(binned, np.nan_to_num(expected).reshape((5, 10, 10)).mean(-1), rtol=1e-5)
+    with pytest.raises(ValueError):
+        ex.extract(Interval("chr1", 0, 15))
+
+    ex2 = pickle.loads(pickle.dumps(ex))
+    np.testing.assert_allclose(ex2.extract_batch(intervals), binned)
+    with pytest.raises(KeyError):
+        ex.extract(Interval("chrX", 0, 10))
+
+
+@pytest.mark.parametrize("block_size", [7, 128, 2 ** 16])
+def test_bigwig_extractor_past_chromosome_end(bigwig_file, block_size):
+    from kipoiseq.extractors import BigWigExtractor
+    ex = BigWigExtractor(bigwig_file, nan_value=None, block_size=block_size)
+    # fully and partly past the end of chr1 (1000 bp) and chr2 (50 bp)
+    intervals = [Interval("chr1", 1050, 1200), Interval("chr1", 1000, 1150), Interval("chr1", 900, 1050),
+                 Interval("chr2", 60, 210), Interval("chr2", 20, 170)]
+    out = ex.extract_batch(intervals)
+    np.testing.assert_allclose(out, np.stack([_expected_signal(i.chrom, i.start, i.stop) for i in intervals]),
+                               rtol=1e-6)
+    assert np.isnan(out[0]).all() and np.isnan(out[3]).all()
+
+
+def test_bigwig_extractor_cache_bounded(bigwig_file):
+    from kipoiseq.extractors import BigWigExtractor
+    ex = BigWigExtractor(bigwig_file, block_size=100, cache_max_bytes=3 * 100 * 4)
+    ex.extract_batch([Interval("chr1", i, i + 100) for i in range(0, 1000, 100)])
+    stats = ex.cache.get_stats()
+    assert stats["entries"] == 3
+    assert stats["nbytes"] <= 3 * 100 * 4
+    assert stats["evictions"] == 7
+
+
+@pytest.mark.parametrize("bgzf_threads", [1, 4])
+def test_fastareader_bgzf(tmpdir, bgzf_threads):
+    bgzf = pytest.importorskip("Bio.bgzf")
+    rng = np.random.RandomState(42)
+    seq = "".join(rng.choice(list("ACGTNacgt"), 200000))
+    content = ">chr1\n" + "\n".join(seq[i:i + 60] for i in range(0, len(seq), 60)) + "\n>chr2\nACGTTT\n"
+    fp = str(tmpdir.join("seq.fa"))
+    with open(fp, "w") as f:
+        f.write(content)
+    with bgzf.BgzfWriter(fp + ".gz", "wb") as f:
+        f.write(content.encode())
+
+    fr = FastaStringExtractor(fp, use_strand=True)
+    # small cache: at most 3 decompressed blocks of 64kb
+    gz = FastaStringExtractor(fp + ".gz", use_strand=True, bgzf_cache_bytes=3 * 2 ** 16,
+                              bgzf_threads=bgzf_threads)
+    starts = rng.randint(0, 200000, 200)
+    intervals = [Interval("chr1", s, s + l, strand=st)
+                 for s, l, st in zip(starts, rng.randint(0, 5000, 200), rng.choice(["+", "-"], 200))]
+    intervals.append(Interval("chr2", 0, 10))
+    expected = [fr.extract(i) for i in intervals]
+
+    assert [gz.extract(i) for i in intervals] == expected
+    assert gz.extract_batch(intervals) == expected
+    stats = gz._bgzf_reader.cache.get_stats()
+    assert stats["hits"] > 0
+    assert stats["nbytes"] <= 3 * 2 ** 16
+
+    # neighbouring reads don't decompress the block again
+    misses = stats["misses"]
+    gz.extract(Interval("chr1", 100, 200))
+    gz.extract(Interval("chr1", 200, 300))
+    assert gz._bgzf_reader.cache.get_stats()["misses"] <= misses + 1
+
+    gz2 = pickle.loads(pickle.dumps(gz))
+    assert gz2.extract_batch(intervals[:10]) == expected[:10]
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4, 64])
+def test_fastareader_async(max_concurrency):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    fr = FastaStringExtractor("tests/data/sample.5kb.fa", use_strand=True)
+    intervals = [Interval("chr1", i, i + 50, strand="+-"[i % 2]) for i in range(0, 4000, 31)]
+    expected = [fr.extract(i) for i in intervals]
+
+    async def run(executor=None):
+        single = await fr.aextract(intervals[0], executor=executor)
+        seqs = [seq async for seq in fr.aextract_batch(intervals, max_concurrency=max_concurrency,
+                                                       executor=executor)]
+        return single, seqs
+
+    assert asyncio.run(run()) == (expected[0], expected)
+    with ThreadPoolExecutor(2) as executor:
+        assert asyncio.run(run(executor)) == (expected[0], expected)
+
+    async def run_partial():
+        # stop consuming early
+        async for seq in fr.aextract_batch(intervals, max_concurrency=max_concurrency):
+            return seq
+    assert asyncio.run(run_partial()) == expected[0]
@@ -18,3 +18,5 @@ def test_parse_type():
     assert parse_dtype('float') == float
     assert parse_dtype(float) == float
     assert parse_dtype("np.float32") == np.float32
+    assert parse_dtype("float16") == np.float16
+    assert parse_dtype("uint8") == np.uint8
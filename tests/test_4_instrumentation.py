@@ -0,0 +1,93 @@
+import pytest
+from pybedtools import Interval
+from kipoiseq import instrumentation
+from kipoiseq.extractors import FastaStringExtractor, VariantSeqExtractor, MultiSampleVCF
+from kipoiseq.dataloaders import SeqIntervalDl
+from kipoiseq.transforms import CachedTransform, OneHot
+
+
+@pytest.fixture
+def instrumented():
+    instrumentation.reset_stats()
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+    instrumentation.reset_stats()
+
+
+def test_disabled_is_not_patched():
+    original = FastaStringExtractor.extract
+    instrumentation.enable()
+    assert instrumentation.is_enabled()
+    assert FastaStringExtractor.extract is not original
+    instrumentation.disable()
+    assert not instrumentation.is_enabled()
+    assert FastaStringExtractor.extract is original
+
+    instrumentation.reset_stats()
+    FastaStringExtractor("tests/data/sample.5kb.fa").extract(Interval("chr1", 0, 10))
+    assert instrumentation.get_stats() == {}
+
+
+def test_extractor_stats(instrumented):
+    fr = FastaStringExtractor("tests/data/sample.5kb.fa")
+    for i in range(5):
+        assert len(fr.extract(Interval("chr1", i, i + 10))) == 10
+    stats = instrumentation.get_stats()["FastaStringExtractor.extract"]
+    assert stats["calls"] == 5
+    assert stats["bytes"] == 50
+    assert stats["time"] > 0
+    assert sum(stats["latency_histogram"]) == 5
+    assert len(stats["latency_histogram"]) == instrumentation.HISTOGRAM_BINS
+
+    # cache hits
+    cached = CachedTransform(OneHot())
+    cached("ACGT")
+    cached("ACGT")
+    cached("ACGG")
+    stats = instrumentation.get_stats()
+    assert stats["LRUCache.get"]["calls"] == 3
+    assert stats["LRUCache.get"]["cache_hits"] == 1
+    assert stats["OneHot.__call__"]["calls"] == 2
+
+
+def test_variant_stats(instrumented):
+    vcf = MultiSampleVCF("tests/data/test.vcf.gz")
+    extractor = VariantSeqExtractor("tests/data/sample.5kb.fa")
+    interval = Interval("chr1", 0, 1000)
+    variants = list(vcf.fetch_variants(interval))
+    extractor.extract(interval, variants, anchor=0)
+    stats = instrumentation.get_stats()
+    assert stats["MultiSampleVCF.fetch_variants"]["calls"] == 1
+    assert stats["VariantSeqExtractor.extract"]["calls"] == 1
+    assert stats["VariantSeqExtractor.extract"]["bytes"] == 1000
+    # the reference is read through the fasta extractor
+    assert stats["FastaStringExtractor._read_bytes"]["calls"] >= 1
+    assert stats["FastaStringExtractor._read_bytes"]["bytes"] >= 1000
+
+
+def test_dataloader_stats(instrumented):
+    dl = SeqIntervalDl("tests/data/sample_intervals.bed", "tests/data/sample.fasta")
+    for i in range(len(dl)):
+        dl[i]
+    stats = instrumentation.get_stats()
+    assert stats["SeqIntervalDl.__getitem__"]["calls"] == len(dl)
+    assert stats["BedDataset.__getitem__"]["calls"] == len(dl)
+    assert stats["FastaOneHotExtractor.extract"]["calls"] == len(dl)
+    assert stats["FastaStringExtractor._read_bytes"]["calls"] == len(dl)
+
+
+def test_merge_stats():
+    a = {"x": {"calls": 1, "bytes": 10, "cache_hits": 0, "time": 1.0,
+               "latency_histogram": [1, 0] + [0] * 30}}
+    b = {"x": {"calls": 2, "bytes": 5, "cache_hits": 1, "time": 0.5,
+               "latency_histogram": [0, 2] + [0] * 30},
+         "y": {"calls": 1, "bytes": 0, "cache_hits": 0, "time": 0.1,
+               "latency_histogram": [1] + [0] * 31}}
+    merged = instrumentation.merge_stats(a, b)
+    assert merged["x"]["calls"] == 3
+    assert merged["x"]["bytes"] == 15
+    assert merged["x"]["cache_hits"] == 1
+    assert merged["x"]["time"] == 1.5
+    assert merged["x"]["latency_histogram"][:2] == [1, 2]
+    assert merged["y"] == b["y"]